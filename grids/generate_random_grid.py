@@ -2,44 +2,38 @@
 #
 # Generates a random gridfile for the simulation to use
 
-import json, argparse, random, sys
+import argparse, json, os, random, sys
 import numpy as np
 from opensimplex import OpenSimplex
 
-parser = argparse.ArgumentParser(description='Uses noise maps to generate a random landscape grid for the simulation to use. Outputs a gridfile as JSON to stdout.')
-
-parser.add_argument("-W", "--width", type=int, help="Width of the grid", default=50)
-parser.add_argument("-H", "--height", type=int, help="Height of the grid", default=50)
-parser.add_argument("-w", "--wind-speed", type=int, help="Wind speed in m/s", default=5)
-parser.add_argument("-d", "--wind-dir", help="Wind direction as a vector x,y", default='1,1')
-parser.add_argument("-s", "--seed", type=int, help="Seed for terrain generation", default=random.random())
-parser.add_argument("-f", "--frequency", type=float, help="Base terrain generation frequency (defines zoom level)", default=2.0)
-parser.add_argument("-e", "--alt_exp", type=float, help="Exponential for altitude generation (defines how 'hilly' the terrain is)", default=0.20)
-parser.add_argument("-a", "--max-alt", type=int, help="Maximum altitude of the terrain", default=1500)
-parser.add_argument("-l", "--water-level", type=float, help="Height of water (0-1)", default=0.05)
-parser.add_argument("-p", "--p0", type=float, help="Base probability of cell ignition", default=0.58)
-
-# Parse the arguments
-args = parser.parse_args()
-
-# Argument formatting
-width = args.width
-height = args.height
-wind_speed = args.wind_speed
-wind_dir = tuple(map(int, args.wind_dir.split(',')))
-seed = args.seed
-base_freq = args.frequency
-alt_exp = args.alt_exp
-max_alt = args.max_alt
-water_level = args.water_level
-p0 = args.p0
+# The simulation itself, for the cell codes and the binary grid format
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'wildfire_simulator'
+))
+from ca import gridfile
+from ca.cell import Cell
+
+# Vegetation and density codes, see Cell.vegetations and Cell.densities
+NOV, AGR, FOR, SHR = (Cell.vegetations.index(veg)
+                      for veg in ('nov', 'agr', 'for', 'shr'))
+DENS_NOV, SPA, NOR, DEN = (Cell.densities.index(dens)
+                           for dens in ('nov', 'spa', 'nor', 'den'))
+
+# OpenSimplex constants, see the opensimplex package
+STRETCH_CONSTANT_2D = -0.211324865405187
+SQUISH_CONSTANT_2D = 0.366025403784439
+NORM_CONSTANT_2D = 47
+GRADIENTS_2D = np.array([
+     5,  2,    2,  5,
+    -5,  2,   -2,  5,
+     5, -2,    2, -5,
+    -5, -2,   -2, -5,
+])
+
 
 def plot_map(altmap, vegmap, densmap):
     """Plot the map using matplotlib"""
-    global width, height, max_alt
-
     import matplotlib.pyplot as plt
-    import numpy as np
     from mpl_toolkits.mplot3d import Axes3D
 
     fig = plt.figure()
@@ -47,245 +41,424 @@ def plot_map(altmap, vegmap, densmap):
 
     colors = get_colormap(vegmap, densmap)
 
-    x, y = range(width), range(height)
-    X, Y = np.meshgrid(x, y)
+    height, width = altmap.shape
+    X, Y = np.meshgrid(range(width), range(height))
 
     ax.plot_surface(X, Y, altmap, facecolors=colors)
     ax.set_zlim(0, 1)
 
     plt.show()
 
-def noise(gen, x, y, fx=1, fy=1):
+def noise2d(gen, x, y):
+    """
+    Evaluate 2D OpenSimplex noise for whole arrays of coordinates at once.
+
+    This is OpenSimplex.noise2d with every branch turned into an array
+    selection, so it gives the same values as calling it point by point.
+
+    Params:
+    - gen: The noise generator to use
+    - x: X-coordinates
+    - y: Y-coordinates
+    """
+    perm = np.array(gen._perm)
+
+    def extrapolate(xsb, ysb, dx, dy):
+        index = perm[(perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+        return GRADIENTS_2D[index] * dx + GRADIENTS_2D[index + 1] * dy
+
+    def contribution(xsb, ysb, dx, dy):
+        attn = 2 - dx * dx - dy * dy
+        attn_sq = attn * attn
+        return np.where(
+            attn > 0, attn_sq * attn_sq * extrapolate(xsb, ysb, dx, dy), 0
+        )
+
+    # Place input coordinates onto grid.
+    stretch_offset = (x + y) * STRETCH_CONSTANT_2D
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+
+    # Floor to get grid coordinates of rhombus (stretched square) super-cell
+    # origin.
+    xsb = np.floor(xs).astype(np.int64)
+    ysb = np.floor(ys).astype(np.int64)
+
+    # Skew out to get actual coordinates of rhombus origin.
+    squish_offset = (xsb + ysb) * SQUISH_CONSTANT_2D
+    xb = xsb + squish_offset
+    yb = ysb + squish_offset
+
+    # Compute grid coordinates relative to rhombus origin.
+    xins = xs - xsb
+    yins = ys - ysb
+
+    # Sum those together to get a value that determines which region we're in.
+    in_sum = xins + yins
+
+    # Positions relative to origin point.
+    dx0 = x - xb
+    dy0 = y - yb
+
+    # Contribution (1,0)
+    value = contribution(
+        xsb + 1, ysb, dx0 - 1 - SQUISH_CONSTANT_2D, dy0 - SQUISH_CONSTANT_2D
+    )
+
+    # Contribution (0,1)
+    value += contribution(
+        xsb, ysb + 1, dx0 - SQUISH_CONSTANT_2D, dy0 - 1 - SQUISH_CONSTANT_2D
+    )
+
+    # The extra vertex, depending on which triangle we're in and which
+    # vertices are closest
+    lower = in_sum <= 1
+    zins = np.where(lower, 1 - in_sum, 2 - in_sum)
+    x_larger = xins > yins
+    zero_close = np.where(
+        lower, (zins > xins) | (zins > yins), (zins < xins) | (zins < yins)
+    )
+    s2 = 2 * SQUISH_CONSTANT_2D
+
+    conditions = [
+        lower & zero_close & x_larger,
+        lower & zero_close,
+        lower,
+        zero_close & x_larger,
+        zero_close,
+    ]
+    xsv_ext = np.select(
+        conditions, [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb], xsb
+    )
+    ysv_ext = np.select(
+        conditions, [ysb - 1, ysb + 1, ysb + 1, ysb, ysb + 2], ysb
+    )
+    dx_ext = np.select(conditions, [
+        dx0 - 1, dx0 + 1, dx0 - 1 - s2, dx0 - 2 - s2, dx0 + 0 - s2
+    ], dx0)
+    dy_ext = np.select(conditions, [
+        dy0 + 1, dy0 - 1, dy0 - 1 - s2, dy0 + 0 - s2, dy0 - 2 - s2
+    ], dy0)
+
+    # Contribution (0,0) or (1,1)
+    xsb = np.where(lower, xsb, xsb + 1)
+    ysb = np.where(lower, ysb, ysb + 1)
+    dx0 = np.where(lower, dx0, dx0 - 1 - s2)
+    dy0 = np.where(lower, dy0, dy0 - 1 - s2)
+    value += contribution(xsb, ysb, dx0, dy0)
+
+    # Extra Vertex
+    value += contribution(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+    return value / NORM_CONSTANT_2D
+
+def noise(gen, width, height, base_freq, fx=1, fy=1, window=None):
     """
-    Generate a noise value between 0.0 and 1.0.
+    Generate a map of noise values between 0.0 and 1.0.
 
     Params:
     - gen: The noise generator to use
-    - x: X-coordinate in the grid
-    - y: Y-coordinate in the grid
+    - width: Width of the grid
+    - height: Height of the grid
+    - base_freq: Base frequency of the noise
     - fx: X-frequency, relative to base frequency
     - fy: Y-frequency, relative to base frequency
+    - window: Rows and columns (y0, y1, x0, x1) of the part of the grid to
+              generate, all of it if None
     """
-    global width, height, base_freq
-
     # Apply base frequencies
     fx, fy = fx * base_freq, fy * base_freq
 
-    nx, ny = x / width - 0.5, y / height - 0.5
-    return gen.noise2d(fx * nx, fx * ny) / 2.0 + 0.5
+    y0, y1, x0, x1 = window or (0, height, 0, width)
 
-# Seed the random number generator
-random.seed(seed)
+    # Evaluate blocks of rows at once, which bounds the memory used by the
+    # temporary arrays of the noise function
+    values = np.empty((y1 - y0, x1 - x0))
+    block = max(1, 2**18 // (x1 - x0))
+    for start in range(y0, y1, block):
+        y, x = np.mgrid[start:min(start + block, y1), x0:x1]
+        nx, ny = x / width - 0.5, y / height - 0.5
+        values[start - y0:start - y0 + block] = \
+            noise2d(gen, fx * nx, fx * ny) / 2.0 + 0.5
 
-# Create the noise generators
-alt_gen = OpenSimplex(seed=random.randint(-sys.maxsize, sys.maxsize))
-veg_gen = OpenSimplex(seed=random.randint(-sys.maxsize, sys.maxsize))
-dens_gen = OpenSimplex(seed=random.randint(-sys.maxsize, sys.maxsize))
+    return values
 
-def gen_alts():
+def gen_alts(alt_gen, width, height, base_freq, alt_exp, water_level,
+             window=None):
     """Generate the altitude map"""
-    global width, height, max_alt, water_level, alt_gen, alt_exp
-    
-    alts = np.empty((height, width), dtype=float)
-    for y in range(height):
-        for x in range(width):
-            alt = noise(alt_gen, x, y)
-
-            # Flatten
-            alt = 1 - alt**alt_exp
+    alts = noise(alt_gen, width, height, base_freq, window=window)
 
-            # Limit until water level
-            if alt < water_level:
-                alt = water_level
+    # Flatten
+    alts = 1 - alts**alt_exp
 
-            alts[y, x] = alt
+    # Limit until water level
+    return np.maximum(alts, water_level)
 
-    return alts
-
-def gen_vegs(altmap):
+def gen_vegs(altmap, veg_gen, width, height, base_freq, water_level, max_alt,
+             window=None):
     """Generate the vegetation map"""
-    global width, height, water_level, veg_gen, max_alt
-
-    vegs = np.empty((height, width), dtype=object)
-    for y in range(height):
-        for x in range(width):
-            alt = altmap[y, x]
-            veg_mod = noise(veg_gen, x, y)
-
-            # Water at the water level
-            if alt <= water_level:
-                vegs[y, x] = 'nov'
-            elif alt * max_alt < 400:
-                if veg_mod < 0.4:
-                    vegs[y, x] = 'agr'
-                elif veg_mod < 0.8:
-                    vegs[y, x] = 'for'
-                else:
-                    vegs[y, x] = 'shr'
-            elif alt * max_alt < 1000:
-                if veg_mod < 0.1:
-                    vegs[y, x] = 'agr'
-                elif veg_mod < 0.6:
-                    vegs[y, x] = 'for'
-                else:
-                    vegs[y, x] = 'shr'
-            elif alt * max_alt < 1400:
-                if veg_mod < 0.7:
-                    vegs[y, x] = 'shr'
-                else:
-                    vegs[y, x] = 'for'
-            else:
-                vegs[y, x] = 'shr'
-
-    return vegs
-
-def gen_dens(altmap, vegmap):
+    alt = altmap * max_alt
+    veg_mod = noise(veg_gen, width, height, base_freq, window=window)
+
+    return np.select([
+        # Water at the water level
+        altmap <= water_level,
+        (alt < 400) & (veg_mod < 0.4),
+        (alt < 400) & (veg_mod < 0.8),
+        alt < 400,
+        (alt < 1000) & (veg_mod < 0.1),
+        (alt < 1000) & (veg_mod < 0.6),
+        alt < 1000,
+        (alt < 1400) & (veg_mod < 0.7),
+        alt < 1400,
+    ], [NOV, AGR, FOR, SHR, AGR, FOR, SHR, SHR, FOR], SHR).astype(np.uint8)
+
+def gen_dens(altmap, vegmap, dens_gen, width, height, base_freq, max_alt,
+             window=None):
     """Generate the density map"""
-    global width, height, dens_gen
-
-    dens = np.empty((height, width), dtype=object)
-    for y in range(height):
-        for x in range(width):
-            alt = altmap[y, x]
-            veg = vegmap[y, x]
-            dens_mod = noise(dens_gen, x, y)
-
-            if veg == 'nov':
-                dens[y, x] = 'nov'
-            elif veg == 'agr':
-                dens[y, x] = 'nor'
-            elif alt * max_alt < 500:
-                if dens_mod < 0.4:
-                    dens[y, x] = 'den'
-                elif dens_mod < 0.7:
-                    dens[y, x] = 'nor'
-                else:
-                    dens[y, x] = 'spa'
-            elif alt * max_alt < 1000:
-                if dens_mod < 0.2:
-                    dens[y, x] = 'den'
-                elif dens_mod < 0.5:
-                    dens[y, x] = 'nor'
-                else:
-                    dens[y, x] = 'spa'
-            elif alt * max_alt < 1400:
-                if dens_mod < 0.05:
-                    dens[y, x] = 'den'
-                elif dens_mod < 0.3:
-                    dens[y, x] = 'nor'
-                elif dens_mod < 0.8:
-                    dens[y, x] = 'spa'
-                else:
-                    dens[y, x] = 'nov'
-            else:
-                if dens_mod < 0.2:
-                    dens[y, x] = 'spa'
-                else:
-                    dens[y, x] = 'nov'
-
-    return dens
+    alt = altmap * max_alt
+    dens_mod = noise(dens_gen, width, height, base_freq, window=window)
+
+    return np.select([
+        vegmap == NOV,
+        vegmap == AGR,
+        (alt < 500) & (dens_mod < 0.4),
+        (alt < 500) & (dens_mod < 0.7),
+        alt < 500,
+        (alt < 1000) & (dens_mod < 0.2),
+        (alt < 1000) & (dens_mod < 0.5),
+        alt < 1000,
+        (alt < 1400) & (dens_mod < 0.05),
+        (alt < 1400) & (dens_mod < 0.3),
+        (alt < 1400) & (dens_mod < 0.8),
+        alt < 1400,
+        dens_mod < 0.2,
+    ], [
+        DENS_NOV, NOR, DEN, NOR, SPA, DEN, NOR, SPA, DEN, NOR, SPA, DENS_NOV,
+        SPA
+    ], DENS_NOV).astype(np.uint8)
+
+def find_ignition(vegrow):
+    """Find the cell to ignite in the middle row of the vegetation map"""
+    # Primitive way of finding a flammable cell
+    x = int(len(vegrow) / 2)
+    while vegrow[x] == NOV:
+        x += 1
+
+    return x
 
 def gen_states(vegmap):
     """Generate initial states"""
-    global width, height
-
-    states = np.zeros((height, width), dtype=int)
-
-    # Primitive way of finding a flammable cell
-    x, y = int(width / 2), int(height / 2)
-    while vegmap[y, x] == 'nov':
-        x += 1
+    height, width = vegmap.shape
+    states = np.zeros((height, width), dtype=np.uint8)
 
     # Ignite one cell
-    states[y, x] = 1
+    y = int(height / 2)
+    states[y, find_ignition(vegmap[y])] = 1
 
     return states
 
 
-def get_colormap(vegmap, dens_map):
+def get_colormap(vegmap, densmap):
     """Generate colors for vegetation map"""
-    colors = np.empty((height, width), dtype=tuple)
-
-    for y in range(height):
-        for x in range(width):
-            veg = vegmap[y, x]
-            dens = densmap[y, x]
-
-            if veg == 'nov':
-                # Blue
-                colors[y, x] = 0, 105, 148
-            elif dens == 'nov':
-                # Gray
-                colors[y, x] = 188, 188, 188
-            elif veg == 'for':
-                # Forest green
-                if dens == 'den':
-                    colors[y, x] = 13, 72, 13
-                elif dens == 'nor':
-                    colors[y, x] = 59, 128, 59
-                else:
-                    colors[y, x] = 149, 193, 149
-            elif veg == 'agr':
-                # Wheat yellow
-                if dens == 'den':
-                    colors[y, x] = 242, 210, 50
-                elif dens == 'nor':
-                    colors[y, x] = 236, 221, 147
-                else:
-                    colors[y, x] = 210, 205, 178
-            elif veg == 'shr':
-                # Shrubland green
-                if dens == 'den':
-                    colors[y, x] = 105, 200, 105
-                elif dens == 'nor':
-                    colors[y, x] = 162, 220, 162
-                else:
-                    colors[y, x] = 192, 220, 192
-
-            colors[y, x] = tuple([c / 255 for c in colors[y, x]])
-
-    return colors
-
-def build_grid(altmap, vegmap, densmap, statesmap):
-    """Build the grid"""
-    global width, height
-
-    grid = []
-    for y in range(height):
-        row = []
-        for x in range(width):
-            cell = {}
-            cell['alt'] = float(altmap[y, x])
-            cell['veg'] = str(vegmap[y, x])
-            cell['den'] = str(densmap[y, x])
-            cell['sta'] = int(statesmap[y, x])
-            
-            row.append(cell)
-        grid.append(row)
-
-    return grid
-
-
-# Generate altitudes
-altmap = gen_alts()
-
-# Generate vegetation biomes
-vegmap = gen_vegs(altmap)
-
-# Generate density map
-densmap = gen_dens(altmap, vegmap)
-
-# Generate states map
-statesmap = gen_states(vegmap)
-
-# Build the grid
-grid = build_grid(altmap, vegmap, densmap, statesmap)
-
-retval = {}
-retval['wind_dir'] = wind_dir
-retval['wind_speed'] = wind_speed
-retval['max_alt'] = max_alt
-retval['p0'] = p0
-retval['grid'] = grid
-
-print(json.dumps(retval))
+    # Colors of all vegetation and density combinations, as the cells have
+    palette = np.array([
+        [Cell(0, veg=veg, dens=dens).get_color() for dens in Cell.densities]
+        for veg in Cell.vegetations
+    ])
+
+    return palette[vegmap, densmap]
+
+def generate_grid(width=50, height=50, wind_speed=5, wind_dir=(1, 1),
+                  seed=None, base_freq=2.0, alt_exp=0.20, max_alt=1500,
+                  water_level=0.05, p0=0.58, window=None):
+    """
+    Generate a random landscape.
+
+    Returns the configuration of the grid as a dict, like in the gridfiles,
+    and the altitude (0-1), vegetation code, density code and state maps.
+
+    Params:
+    - width: Width of the grid
+    - height: Height of the grid
+    - wind_speed: Wind speed in m/s
+    - wind_dir: Wind direction as a vector (x, y)
+    - seed: Seed for terrain generation, random if None
+    - base_freq: Base terrain generation frequency (defines zoom level)
+    - alt_exp: Exponential for altitude generation (defines how 'hilly' the
+               terrain is)
+    - max_alt: Maximum altitude of the terrain
+    - water_level: Height of water (0-1)
+    - p0: Base probability of cell ignition
+    - window: Rows and columns (y0, y1, x0, x1) of the part of the landscape
+              to generate, all of it if None. The parts of a landscape join
+              seamlessly.
+    """
+    # Seed the random number generator
+    rng = random.Random(random.random() if seed is None else seed)
+
+    # Create the noise generators
+    alt_gen = OpenSimplex(seed=rng.randint(-sys.maxsize, sys.maxsize))
+    veg_gen = OpenSimplex(seed=rng.randint(-sys.maxsize, sys.maxsize))
+    dens_gen = OpenSimplex(seed=rng.randint(-sys.maxsize, sys.maxsize))
+
+    def gen_maps(window):
+        # Generate altitudes
+        altmap = gen_alts(
+            alt_gen, width, height, base_freq, alt_exp, water_level, window
+        )
+
+        # Generate vegetation biomes
+        vegmap = gen_vegs(
+            altmap, veg_gen, width, height, base_freq, water_level, max_alt,
+            window
+        )
+
+        return altmap, vegmap
+
+    altmap, vegmap = gen_maps(window)
+
+    # Generate density map
+    densmap = gen_dens(
+        altmap, vegmap, dens_gen, width, height, base_freq, max_alt, window
+    )
+
+    # Generate states map
+    if window is None:
+        statesmap = gen_states(vegmap)
+    else:
+        # The cell to ignite depends on the middle row of the landscape
+        y0, y1, x0, x1 = window
+        y = int(height / 2)
+        x = find_ignition(gen_maps((y, y + 1, 0, width))[1][0])
+
+        statesmap = np.zeros(altmap.shape, dtype=np.uint8)
+        if y0 <= y < y1 and x0 <= x < x1:
+            statesmap[y - y0, x - x0] = 1
+
+    conf = {}
+    conf['wind_dir'] = list(wind_dir)
+    conf['wind_speed'] = wind_speed
+    conf['max_alt'] = max_alt
+    conf['p0'] = p0
+
+    return conf, altmap, vegmap, densmap, statesmap
+
+def generate_tiles(directory, tile_size, **params):
+    """
+    Generate a random landscape as a directory of binary tiles.
+
+    Only one tile is in memory at a time, so the landscape can be larger
+    than the memory. See generate_grid for the parameters of the landscape.
+
+    Params:
+    - directory: Directory to write the tiles to
+    - tile_size: Amount of rows and columns of a tile
+    """
+    # All tiles must come from the same noise
+    if params.get('seed') is None:
+        params['seed'] = random.random()
+
+    width = params.get('width', 50)
+    height = params.get('height', 50)
+
+    os.makedirs(directory, exist_ok=True)
+    counts = np.zeros(3, dtype=np.int64)
+    ignitions = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            window = (
+                y0, min(y0 + tile_size, height),
+                x0, min(x0 + tile_size, width)
+            )
+            conf, *maps = generate_grid(window=window, **params)
+            tile = y0 // tile_size, x0 // tile_size
+
+            write_binary(gridfile.tile_filename(directory, *tile), conf, *maps)
+
+            statesmap = maps[3]
+            counts += np.bincount(statesmap.ravel(), minlength=3)[:3]
+            if (statesmap == 1).any():
+                ignitions.append(tile)
+
+    gridfile.write_manifest(
+        directory, conf, height, width, tile_size, counts.tolist(), ignitions
+    )
+
+def write_json(f, conf, altmap, vegmap, densmap, statesmap):
+    """Write the grid as a JSON gridfile, row by row"""
+    vegs = np.array(Cell.vegetations)
+    dens = np.array(Cell.densities)
+
+    f.write(json.dumps(conf)[:-1] + ', "grid": [')
+    for y in range(altmap.shape[0]):
+        row = [
+            {'alt': alt, 'veg': veg, 'den': den, 'sta': sta}
+            for alt, veg, den, sta in zip(
+                altmap[y].tolist(), vegs[vegmap[y]].tolist(),
+                dens[densmap[y]].tolist(), statesmap[y].tolist()
+            )
+        ]
+
+        if y > 0:
+            f.write(', ')
+        f.write(json.dumps(row))
+    f.write(']}')
+
+def write_binary(filename, conf, altmap, vegmap, densmap, statesmap):
+    """Write the grid as a binary gridfile"""
+    gridfile.write_binary(
+        filename, conf, statesmap, altmap * conf['max_alt'], vegmap, densmap
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Uses noise maps to generate a random landscape grid for the simulation to use. Outputs a gridfile as JSON to stdout.')
+
+    parser.add_argument("-W", "--width", type=int, help="Width of the grid", default=50)
+    parser.add_argument("-H", "--height", type=int, help="Height of the grid", default=50)
+    parser.add_argument("-w", "--wind-speed", type=int, help="Wind speed in m/s", default=5)
+    parser.add_argument("-d", "--wind-dir", help="Wind direction as a vector x,y", default='1,1')
+    parser.add_argument("-s", "--seed", type=int, help="Seed for terrain generation", default=random.random())
+    parser.add_argument("-f", "--frequency", type=float, help="Base terrain generation frequency (defines zoom level)", default=2.0)
+    parser.add_argument("-e", "--alt_exp", type=float, help="Exponential for altitude generation (defines how 'hilly' the terrain is)", default=0.20)
+    parser.add_argument("-a", "--max-alt", type=int, help="Maximum altitude of the terrain", default=1500)
+    parser.add_argument("-l", "--water-level", type=float, help="Height of water (0-1)", default=0.05)
+    parser.add_argument("-p", "--p0", type=float, help="Base probability of cell ignition", default=0.58)
+    parser.add_argument("-o", "--output", help="Write the gridfile to this file instead of stdout")
+    parser.add_argument("-b", "--binary", action='store_true', help="Write a binary gridfile instead of JSON (needs --output)")
+    parser.add_argument("-t", "--tile-size", type=int, help="Write the landscape as a directory of binary tiles of this size, named by --output")
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if (args.binary or args.tile_size) and not args.output:
+        parser.error("a binary or tiled gridfile needs --output")
+
+    params = dict(
+        width=args.width,
+        height=args.height,
+        wind_speed=args.wind_speed,
+        wind_dir=tuple(map(int, args.wind_dir.split(','))),
+        seed=args.seed,
+        base_freq=args.frequency,
+        alt_exp=args.alt_exp,
+        max_alt=args.max_alt,
+        water_level=args.water_level,
+        p0=args.p0,
+    )
+
+    # Generate the landscape
+    if args.tile_size:
+        generate_tiles(args.output, args.tile_size, **params)
+        sys.exit()
+
+    grid = generate_grid(**params)
+
+    if args.binary:
+        write_binary(args.output, *grid)
+    elif args.output:
+        with open(args.output, 'w') as f:
+            write_json(f, *grid)
+    else:
+        write_json(sys.stdout, *grid)
@@ -1,19 +1,557 @@
 #! /usr/bin/env python3
 """Entry point of the wildfire simulation."""
 
+import argparse
+import bench
+import json
+import numpy as np
 import sys
+from ca import CA, Checkpointer, NNEvolutionRule, VectorizedNNEvolutionRule
+from ca import STENCILS, EmberSpotting, StopCriteria, WindField
+from ensemble import Ensemble, Scenario
+from history import HistoryWriter
 from simulation import Simulation
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: {} <grid_filename> [interval]".format(sys.argv[0]))
-        sys.exit(1)
+# Evolution rules that can be chosen on the command line
+RULES = {
+    'nn': NNEvolutionRule,
+    'vectorized': VectorizedNNEvolutionRule,
+}
+
+
+def positive_int(value):
+    """
+    Parse a command line argument as an integer of at least 1.
+
+    Params:
+    - value: The argument
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("should be at least 1")
+    return number
+
+
+def wind_field(args):
+    """Return the wind field of the arguments, or None."""
+    if args.wind_field is None:
+        return None
+    return WindField.load(args.wind_field)
+
+
+def spotting(args):
+    """Return the spotting of the arguments, or None."""
+    if not args.spotting:
+        return None
+    return EmberSpotting()
+
+
+def stop_criteria(args):
+    """Return the stop criteria of the arguments, or None."""
+    mask = None
+    if args.stop_mask is not None:
+        mask = np.load(args.stop_mask)
+
+    if args.max_steps is None and args.max_seconds is None \
+            and args.max_burned is None and mask is None \
+            and not args.stop_at_boundary:
+        return None
+    return StopCriteria(
+        args.max_steps, args.max_seconds, args.max_burned, mask,
+        args.stop_at_boundary
+    )
+
+
+def stencil(args):
+    """Return the stencil of the arguments."""
+    return STENCILS[args.stencil]
+
+
+def add_stencil_arguments(parser):
+    """
+    Add the argument of the stencil to a command.
+
+    Params:
+    - parser: The parser of the command
+    """
+    parser.add_argument(
+        "--stencil", choices=STENCILS, default='moore',
+        help="Neighbors of a cell: the 3x3 (moore) or 5x5 (moore2) square, "
+             "the 3x3 square with the knight moves (knight), or the 6 "
+             "neighbors of a hexagonal grid in axial coordinates (hex). "
+             "With moore2-falloff and knight-falloff the neighbors beyond "
+             "the 3x3 square ignite a cell less, by their distance"
+    )
+
+
+def add_stop_arguments(parser):
+    """
+    Add the arguments of the stop criteria to a command.
+
+    Params:
+    - parser: The parser of the command
+    """
+    parser.add_argument(
+        "--max-steps", type=int,
+        help="Stop a run after this many steps"
+    )
+    parser.add_argument(
+        "--max-seconds", type=float,
+        help="Stop a run after this many seconds"
+    )
+    parser.add_argument(
+        "--max-burned", type=int,
+        help="Stop a run once this many cells burned out"
+    )
+    parser.add_argument(
+        "--stop-mask",
+        help="NumPy .npy file with a boolean array over the grid, to stop a "
+             "run once the fire reaches any of its cells"
+    )
+    parser.add_argument(
+        "--stop-at-boundary", action="store_true",
+        help="Stop a run once the fire reaches the edge of the grid"
+    )
+
+
+def run(args):
+    """Show the animated simulation."""
+    sim = Simulation(
+        args.grid_file, args.interval, RULES[args.rule], args.frontier,
+        args.seed, wind_field=wind_field(args), spotting=spotting(args),
+        stencil=stencil(args)
+    )
+    sim.run(args.steps_per_frame)
+
+
+def render(args):
+    """Render the simulation to images, without a display."""
+    sim = Simulation(
+        args.grid_file, evolution_rule=RULES[args.rule],
+        frontier=args.frontier, seed=args.seed, wind_field=wind_field(args),
+        spotting=spotting(args), stencil=stencil(args)
+    )
+    frames = sim.render(
+        args.output, args.every, args.steps, args.scale, args.fps,
+        args.background
+    )
+    print("Rendered {} frames to {}".format(frames, args.output))
+
+
+def scar(args):
+    """Follow the burn scar until the fire is out, with checkpoints."""
+    if args.resume is not None:
+        sim = Simulation(
+            None, resume=args.resume, wind_field=wind_field(args),
+            spotting=spotting(args)
+        )
+    else:
+        sim = Simulation(
+            args.grid_file, evolution_rule=RULES[args.rule],
+            frontier=args.frontier, seed=args.seed,
+            wind_field=wind_field(args), spotting=spotting(args),
+            stencil=stencil(args)
+        )
+
+    checkpointer = None
+    if args.checkpoint:
+        checkpointer = Checkpointer(
+            args.checkpoint, args.checkpoint_steps, args.checkpoint_seconds
+        )
+
+    history = None
+    if args.history:
+        history = HistoryWriter(args.history, append=args.resume is not None)
+
+    try:
+        series = sim.scar_size(checkpointer, history, stop_criteria(args))
+    finally:
+        if history is not None:
+            history.close()
+    print("Burned {} cells in {} steps".format(series[-1], len(series) - 1))
+    if sim.stop_reason != 'out':
+        print("Stopped early: {}".format(sim.stop_reason))
+    if args.output:
+        np.savetxt(args.output, series, fmt='%d')
 
-    if len(sys.argv) > 2:
-        interval = int(sys.argv[2])
+
+def ensemble(args):
+    """Run an ensemble of simulations and summarize the results."""
+    ens = Ensemble(
+        args.grid_file, RULES[args.rule], not args.full_grid,
+        stencil(args)
+    )
+    result = ens.run(
+        args.runs, args.workers, args.seed, args.batch,
+        args.batch is not None, stop_criteria(args)
+    )
+
+    print(result.summary())
+    if args.output:
+        result.save(args.output)
+
+
+def scenarios(args):
+    """Run scenarios of ignitions and winds on a landscape."""
+    ens = Ensemble(
+        args.grid_file, RULES[args.rule], not args.full_grid,
+        stencil(args)
+    )
+    if args.scenario_file:
+        with open(args.scenario_file) as f:
+            runs = [Scenario.from_dict(scenario) for scenario in json.load(f)]
     else:
-        interval = 100
+        runs = Scenario.lattice(ens.ca, args.spacing, args.runs)
+
+    result = ens.run_scenarios(
+        runs, args.workers, args.seed, stop=stop_criteria(args)
+    )
+    print(result.summary())
+    if args.output:
+        result.save(args.output)
+
+
+def benchmark(args):
+    """Benchmark the simulation, optionally against a baseline."""
+    b = bench.Benchmark(
+        RULES, args.sizes, steps=args.steps, repeat=args.repeat,
+        seed=args.seed, max_nn_size=args.max_nn_size
+    )
+    results = b.run(lambda message: print(message, file=sys.stderr))
+
+    if args.output:
+        bench.save(results, args.output)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.baseline:
+        regressions = bench.compare(
+            results, bench.load(args.baseline), args.tolerance
+        )
+        for name, old_value, value in regressions:
+            # any increase from nothing is an infinite one
+            if old_value:
+                change = '{:+.0%}'.format(value / old_value - 1)
+            else:
+                change = '+inf%'
+            print(
+                "Regression in {}: {:.4g} -> {:.4g} ({})".format(
+                    name, old_value, value, change
+                ),
+                file=sys.stderr
+            )
+
+        if regressions:
+            sys.exit(1)
+
+
+def convert(args):
+    """Convert a JSON grid file to the binary format."""
+    CA.from_gridfile(args.grid_file).to_binary_gridfile(args.output)
+
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
 
-    sim = Simulation(sys.argv[1], interval)
-    sim.run()
+    Params:
+    - argv: The arguments, without the program name
+    """
+    parser = argparse.ArgumentParser(
+        prog='wildfire_simulator',
+        description='Simulates wildfires using a CA.'
+    )
+    commands = parser.add_subparsers(dest='command')
+
+    parser_run = commands.add_parser(
+        'run', help='Show the animated simulation (default)'
+    )
+    parser_run.add_argument("grid_file", help="Path to the grid file")
+    parser_run.add_argument(
+        "interval", type=int, nargs='?', default=100,
+        help="Time in ms per frame of the animation"
+    )
+    parser_run.add_argument(
+        "--rule", choices=RULES, default='nn', help="Evolution rule to use"
+    )
+    add_stencil_arguments(parser_run)
+    parser_run.add_argument(
+        "--frontier", action='store_true',
+        help="Only evolve the fire front each step"
+    )
+    parser_run.add_argument(
+        "--steps-per-frame", type=positive_int,
+        help="Evolve this many steps per frame (default: evolve as fast as "
+             "possible and show the latest step each frame)"
+    )
+    parser_run.add_argument(
+        "-s", "--seed", type=int, help="Seed for the random numbers"
+    )
+    parser_run.add_argument(
+        "--wind-field",
+        help="NumPy .npz file with the wind vector (x, y) of every cell as "
+             "'fields', optionally a series changing at the 'steps'"
+    )
+    parser_run.add_argument(
+        "--spotting", action="store_true",
+        help="Let embers fly in the wind and ignite cells further away"
+    )
+    parser_run.set_defaults(func=run)
+
+    parser_render = commands.add_parser(
+        'render', help='Render the simulation to images, without a display'
+    )
+    parser_render.add_argument("grid_file", help="Path to the grid file")
+    parser_render.add_argument(
+        "output",
+        help="A .gif file to write an animation to, or else a directory to "
+             "write PNG images to"
+    )
+    parser_render.add_argument(
+        "-e", "--every", type=positive_int, default=1,
+        help="Amount of steps per rendered frame"
+    )
+    parser_render.add_argument(
+        "-n", "--steps", type=int,
+        help="Maximum amount of steps (default: until the fire is out)"
+    )
+    parser_render.add_argument(
+        "--scale", type=int, default=1,
+        help="Amount of pixels per cell along each axis"
+    )
+    parser_render.add_argument(
+        "--fps", type=int, default=10,
+        help="Frames per second of a GIF animation"
+    )
+    parser_render.add_argument(
+        "--background", action='store_true',
+        help="Write the images in a background thread"
+    )
+    parser_render.add_argument(
+        "--rule", choices=RULES, default='vectorized',
+        help="Evolution rule to use"
+    )
+    add_stencil_arguments(parser_render)
+    parser_render.add_argument(
+        "--frontier", action='store_true',
+        help="Only evolve the fire front each step"
+    )
+    parser_render.add_argument(
+        "-s", "--seed", type=int, help="Seed for the random numbers"
+    )
+    parser_render.add_argument(
+        "--wind-field",
+        help="NumPy .npz file with the wind vector (x, y) of every cell as "
+             "'fields', optionally a series changing at the 'steps'"
+    )
+    parser_render.add_argument(
+        "--spotting", action="store_true",
+        help="Let embers fly in the wind and ignite cells further away"
+    )
+    parser_render.set_defaults(func=render)
+
+    parser_scar = commands.add_parser(
+        'scar', help='Follow the burn scar until the fire is out'
+    )
+    parser_scar.add_argument(
+        "grid_file", nargs='?',
+        help="Path to the grid file, or the directory of a tiled grid"
+    )
+    parser_scar.add_argument(
+        "-o", "--output",
+        help="Save the amount of burned cells per step to this text file"
+    )
+    parser_scar.add_argument(
+        "--history",
+        help="Write the step at which each cell ignited and the counts per "
+             "step to this directory, as the run progresses"
+    )
+    parser_scar.add_argument(
+        "--rule", choices=RULES, default='vectorized',
+        help="Evolution rule to use"
+    )
+    add_stencil_arguments(parser_scar)
+    parser_scar.add_argument(
+        "--frontier", action='store_true',
+        help="Only evolve the fire front each step"
+    )
+    parser_scar.add_argument(
+        "-s", "--seed", type=int, help="Seed for the random numbers"
+    )
+    parser_scar.add_argument(
+        "--checkpoint",
+        help="Save checkpoints of the run to this file, to resume it later"
+    )
+    parser_scar.add_argument(
+        "--checkpoint-steps", type=positive_int,
+        help="Amount of steps between checkpoints"
+    )
+    parser_scar.add_argument(
+        "--checkpoint-seconds", type=float,
+        help="Amount of seconds between checkpoints (default: 600, unless "
+             "--checkpoint-steps is given)"
+    )
+    parser_scar.add_argument(
+        "--resume",
+        help="Resume the run saved in this checkpoint file, with its grid "
+             "file, rule and seed"
+    )
+    parser_scar.add_argument(
+        "--wind-field",
+        help="NumPy .npz file with the wind vector (x, y) of every cell as "
+             "'fields', optionally a series changing at the 'steps'. Give "
+             "it again when resuming."
+    )
+    parser_scar.add_argument(
+        "--spotting", action="store_true",
+        help="Let embers fly in the wind and ignite cells further away. Give "
+             "it again when resuming."
+    )
+    add_stop_arguments(parser_scar)
+    parser_scar.set_defaults(func=scar)
+
+    parser_ensemble = commands.add_parser(
+        'ensemble', help='Run many realizations of the simulation'
+    )
+    parser_ensemble.add_argument("grid_file", help="Path to the grid file")
+    parser_ensemble.add_argument(
+        "-n", "--runs", type=positive_int, default=100,
+        help="Amount of realizations to run"
+    )
+    parser_ensemble.add_argument(
+        "-k", "--workers", type=int,
+        help="Amount of worker processes (default: amount of CPUs)"
+    )
+    parser_ensemble.add_argument(
+        "-s", "--seed", type=int, help="Seed for the random numbers"
+    )
+    parser_ensemble.add_argument(
+        "-o", "--output",
+        help="Save the burn probabilities and scar sizes to this .npz file"
+    )
+    parser_ensemble.add_argument(
+        "-b", "--batch", type=positive_int,
+        help="Evolve this many runs at once as one stacked array"
+    )
+    parser_ensemble.add_argument(
+        "--rule", choices=RULES, default='vectorized',
+        help="Evolution rule to use"
+    )
+    add_stencil_arguments(parser_ensemble)
+    parser_ensemble.add_argument(
+        "--full-grid", action='store_true',
+        help="Evolve the whole grid each step instead of the fire front"
+    )
+    add_stop_arguments(parser_ensemble)
+    parser_ensemble.set_defaults(func=ensemble)
+
+    parser_scenarios = commands.add_parser(
+        'scenarios', help='Run scenarios of ignitions and winds'
+    )
+    parser_scenarios.add_argument("grid_file", help="Path to the grid file")
+    parser_scenarios.add_argument(
+        "scenario_file", nargs='?',
+        help="JSON file with a list of scenarios, each with the ignitions as "
+             "[y, x] pairs and optionally the wind_dir, wind_speed and runs "
+             "(default: a scenario per ignition point on a lattice)"
+    )
+    parser_scenarios.add_argument(
+        "--spacing", type=positive_int, default=10,
+        help="Amount of cells between the ignition points of the lattice"
+    )
+    parser_scenarios.add_argument(
+        "-n", "--runs", type=positive_int, default=1,
+        help="Amount of realizations per scenario on the lattice"
+    )
+    parser_scenarios.add_argument(
+        "-k", "--workers", type=int,
+        help="Amount of worker processes (default: amount of CPUs)"
+    )
+    parser_scenarios.add_argument(
+        "-s", "--seed", type=int, help="Seed for the random numbers"
+    )
+    parser_scenarios.add_argument(
+        "-o", "--output", help="Save the results table to this CSV file"
+    )
+    parser_scenarios.add_argument(
+        "--rule", choices=RULES, default='vectorized',
+        help="Evolution rule to use"
+    )
+    add_stencil_arguments(parser_scenarios)
+    parser_scenarios.add_argument(
+        "--full-grid", action='store_true',
+        help="Evolve the whole grid each step instead of the fire front"
+    )
+    add_stop_arguments(parser_scenarios)
+    parser_scenarios.set_defaults(func=scenarios)
+
+    parser_bench = commands.add_parser(
+        'bench', help='Benchmark the simulation on generated landscapes'
+    )
+    parser_bench.add_argument(
+        "--sizes", type=lambda sizes: [int(size) for size in sizes.split(',')],
+        default=bench.SIZES,
+        help="Grid sizes to benchmark, as cells per side separated by commas "
+             "(default: {})".format(','.join(map(str, bench.SIZES)))
+    )
+    parser_bench.add_argument(
+        "--steps", type=int, default=20,
+        help="Amount of steps to time per step over"
+    )
+    parser_bench.add_argument(
+        "--repeat", type=int, default=3,
+        help="Amount of repetitions of each timing, of which the fastest "
+             "counts"
+    )
+    parser_bench.add_argument(
+        "-s", "--seed", type=int, default=1,
+        help="Seed of the landscapes and the simulation runs"
+    )
+    parser_bench.add_argument(
+        "--max-nn-size", type=int, default=100,
+        help="Largest grid size to benchmark the nn rule on"
+    )
+    parser_bench.add_argument(
+        "-o", "--output", help="Save the results to this JSON file"
+    )
+    parser_bench.add_argument(
+        "--baseline",
+        help="Compare against the results in this JSON file, and exit with "
+             "status 1 on regressions"
+    )
+    parser_bench.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="Fraction by which times and memory may exceed the baseline"
+    )
+    parser_bench.set_defaults(func=benchmark)
+
+    parser_convert = commands.add_parser(
+        'convert', help='Convert a JSON grid file to the binary format'
+    )
+    parser_convert.add_argument("grid_file", help="Path to the JSON grid file")
+    parser_convert.add_argument("output", help="Path to the binary grid file")
+    parser_convert.set_defaults(func=convert)
+
+    # Running without a command shows the animated simulation
+    if argv and argv[0] not in commands.choices and argv[0][0] != '-':
+        argv = ['run'] + argv
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_usage()
+        sys.exit(1)
+
+    if args.command == 'scar':
+        if args.grid_file is None and args.resume is None:
+            parser_scar.error("a grid file or --resume is required")
+        if args.checkpoint and args.checkpoint_steps is None \
+                and args.checkpoint_seconds is None:
+            args.checkpoint_seconds = 600
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    args.func(args)
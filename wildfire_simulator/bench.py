@@ -0,0 +1,288 @@
+"""Contains the benchmarks, measuring the performance of the simulation."""
+
+from ca import CA
+import json
+import numpy as np
+import os
+import platform
+import random
+from simulation import Simulation
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The landscape generator, from the grids directory
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'grids'
+))
+import generate_random_grid  # noqa: E402
+
+
+# Grid sizes to benchmark by default, as the amount of cells per side
+SIZES = (50, 100, 200, 400)
+
+# Configurations of the CA to benchmark: the evolution rule and whether to
+# only evolve the fire front
+CONFIGURATIONS = {
+    'nn': ('nn', False),
+    'vectorized': ('vectorized', False),
+    'frontier': ('vectorized', True),
+}
+
+# Metrics of which lower values are better, the ones that are compared
+# against a baseline
+COMPARED = ('seconds', 'peak_mb')
+
+
+def measure_time(func, repeat):
+    """
+    Return the shortest time func takes over a number of calls.
+
+    Params:
+    - func: Function to call without arguments
+    - repeat: Amount of calls
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def measure_memory(func):
+    """
+    Return the peak of the memory func allocates, in megabytes.
+
+    Params:
+    - func: Function to call without arguments
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / 2**20
+
+
+def seed_runs(run_seed):
+    """
+    Seed the random number generators of the simulation.
+
+    Params:
+    - run_seed: The seed
+    """
+    random.seed(run_seed)
+    np.random.seed(run_seed)
+
+
+class Benchmark:
+    """Class benchmarking the simulation on generated landscapes."""
+
+    def __init__(self, rules, sizes=SIZES, configurations=CONFIGURATIONS,
+                 steps=20, repeat=3, seed=1, max_nn_size=100):
+        """
+        Construct the benchmark.
+
+        Params:
+        - rules: Evolution rule classes by the names in the configurations
+        - sizes: Grid sizes, as the amount of cells per side
+        - configurations: Names of the configurations to benchmark, mapped to
+                          the name of their evolution rule and whether they
+                          only evolve the fire front
+        - steps: Amount of steps to time CA.step over
+        - repeat: Amount of times each timing is repeated, of which the
+                  shortest counts
+        - seed: Seed of the landscapes and of the simulation runs
+        - max_nn_size: Largest grid size to benchmark the nn rule on, as it
+                       evolves cell by cell
+        """
+        self.rules = rules
+        self.sizes = sizes
+        self.configurations = configurations
+        self.steps = steps
+        self.repeat = repeat
+        self.seed = seed
+        self.max_nn_size = max_nn_size
+
+    def run(self, log=None):
+        """
+        Run the benchmarks.
+
+        Returns the results as a dict with the details of the machine under
+        'meta', and the flat results under 'results', named like
+        '<size>/<benchmark>/<metric>'.
+
+        Params:
+        - log: Function to report progress to, like print
+        """
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for size in self.sizes:
+                if log is not None:
+                    log("Benchmarking a {0}x{0} grid".format(size))
+
+                json_file, binary_file = self.generate(directory, size)
+                for name, value in self.bench_loading(
+                        json_file, binary_file).items():
+                    results['{}/{}'.format(size, name)] = value
+
+                for config, (rule, frontier) in self.configurations.items():
+                    if rule == 'nn' and size > self.max_nn_size:
+                        continue
+
+                    rule = self.rules[rule]
+                    for name, value in self.bench_running(
+                            binary_file, rule, frontier).items():
+                        results['{}/{}/{}'.format(size, config, name)] = value
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'processor': platform.processor(),
+                'cpus': os.cpu_count(),
+                'seed': self.seed,
+                'steps': self.steps,
+                'repeat': self.repeat,
+            },
+            'results': results,
+        }
+
+    def generate(self, directory, size):
+        """
+        Generate a landscape as a JSON and a binary grid file.
+
+        Returns the filenames of both grid files.
+
+        Params:
+        - directory: Directory to write the grid files to
+        - size: Amount of cells per side of the landscape
+        """
+        grid = generate_random_grid.generate_grid(
+            width=size, height=size, seed=self.seed
+        )
+
+        json_file = os.path.join(directory, '{}.json'.format(size))
+        with open(json_file, 'w') as f:
+            generate_random_grid.write_json(f, *grid)
+
+        binary_file = os.path.join(directory, '{}.grid'.format(size))
+        generate_random_grid.write_binary(binary_file, *grid)
+
+        return json_file, binary_file
+
+    def bench_loading(self, json_file, binary_file):
+        """
+        Benchmark loading the grid files.
+
+        Params:
+        - json_file: Path to the JSON grid file
+        - binary_file: Path to the binary grid file
+        """
+        results = {}
+        for name, filename in (('json', json_file), ('binary', binary_file)):
+            def load():
+                CA.from_gridfile(filename)
+
+            results['load_{}/seconds'.format(name)] = measure_time(
+                load, self.repeat
+            )
+            results['load_{}/peak_mb'.format(name)] = measure_memory(load)
+
+        return results
+
+    def bench_running(self, filename, rule, frontier):
+        """
+        Benchmark evolving a CA, step by step and until the fire is out.
+
+        Params:
+        - filename: Path to the grid file
+        - rule: Class to use as the evolution rule
+        - frontier: Only evolve the fire front each step
+        """
+        template = CA.from_gridfile(filename, rule, frontier)
+
+        # the time per step, over the first steps of a run
+        step_times = []
+        for _ in range(self.repeat):
+            seed_runs(self.seed)
+            ca = template.copy()
+            times = []
+            while len(times) < self.steps and ca.burning_cells() > 0:
+                start = time.perf_counter()
+                ca.step()
+                times.append(time.perf_counter() - start)
+            step_times.append(np.median(times) if times else 0.0)
+
+        # whole runs, until the fire is out
+        scar = []
+
+        def scar_size():
+            seed_runs(self.seed)
+            sim = Simulation(filename, evolution_rule=rule, frontier=frontier)
+            scar[:] = sim.scar_size()
+
+        return {
+            'step/seconds': min(step_times),
+            'scar_size/seconds': measure_time(scar_size, self.repeat),
+            'scar_size/peak_mb': measure_memory(scar_size),
+            'scar_size/steps': len(scar) - 1,
+            'scar_size/burned': int(scar[-1]),
+        }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a baseline.
+
+    Returns the regressions, the metrics that are more than the tolerance
+    higher than in the baseline, as a list of (name, baseline, result)
+    tuples. Any increase of a metric that was 0 in the baseline counts as a
+    regression. Only times and memory are compared, and only the metrics that
+    are in both.
+
+    Params:
+    - results: Results of Benchmark.run
+    - baseline: Earlier results of Benchmark.run
+    - tolerance: Fraction by which a metric may increase
+    """
+    regressions = []
+    for name, value in sorted(results['results'].items()):
+        if name not in baseline['results'] \
+                or not name.rsplit('/', 1)[-1] in COMPARED:
+            continue
+
+        old_value = baseline['results'][name]
+        if value > old_value * (1 + tolerance):
+            regressions.append((name, old_value, value))
+
+    return regressions
+
+
+def save(results, filename):
+    """
+    Save benchmark results as JSON.
+
+    Params:
+    - results: Results of Benchmark.run
+    - filename: Path to the JSON file
+    """
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    """
+    Load benchmark results saved as JSON.
+
+    Params:
+    - filename: Path to the JSON file
+    """
+    with open(filename) as f:
+        return json.load(f)
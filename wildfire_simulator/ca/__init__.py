@@ -1,4 +1,18 @@
 """Package for a CA in the context of wildfires."""
 
 from .ca import CA
-from .evolution_rules import NNEvolutionRule
+from .cell import Cell
+from .evolution_rules import NNEvolutionRule, VectorizedNNEvolutionRule
+from .batch import BatchCA
+from .tiled import TiledCA
+from .instrument import Instrument, StepRecorder
+from .rng import CellRandom
+from .checkpoint import Checkpointer, load_checkpoint, save_checkpoint
+from .event_driven import EventDrivenCA
+from .wind import WindField
+from .spotting import EmberSpotting
+from .stencil import (
+    HEXAGONAL, KNIGHT, KNIGHT_FALLOFF, MOORE, MOORE_2, MOORE_2_FALLOFF,
+    STENCILS, Stencil
+)
+from .stop import StopCriteria
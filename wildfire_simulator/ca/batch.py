@@ -0,0 +1,126 @@
+"""Defines a stack of CAs evolving as one, within the simulation."""
+
+import numpy as np
+from .rng import CellRandom, StepRandom
+from .stop import StopCriteria
+
+
+class BatchCA:
+    """
+    Evolves many independent realizations of a CA at once.
+
+    The states of all realizations are stacked in a (runs, height, width)
+    array, which the vectorized evolution rule of the CA evolves in one
+    pass. The ignition probabilities that the rule derived from the landscape
+    are shared by all realizations.
+
+    Seeded realizations draw the same random numbers as a CA with the same
+    seed, so they burn the same as when evolved one by one.
+    """
+
+    def __init__(self, ca, runs, seeds=None):
+        """
+        Construct a batch of realizations of a CA.
+
+        Args:
+        - ca: The CA in its initial state, with a vectorized evolution rule
+        - runs: Amount of realizations
+        - seeds: Seeds of the random numbers of the realizations, see
+                 CA.seed. numpy.random is used when None.
+        """
+        if not getattr(ca.evolution_rule, 'vectorized', False):
+            raise ValueError("Batches need a vectorized evolution rule")
+        if ca.spotting is not None:
+            raise ValueError("Batches don't support spotting")
+
+        self.ca = ca
+        self.state = np.repeat(ca.state[np.newaxis], runs, axis=0)
+        self.steps = ca.steps
+
+        # why each realization stopped, see BatchCA.scar_sizes
+        self.reasons = [None] * runs
+
+        self.randoms = None
+        if seeds is not None:
+            if len(seeds) != runs:
+                raise ValueError("Batches need a seed per realization")
+            self.randoms = [
+                seed if isinstance(seed, CellRandom) else CellRandom(seed)
+                for seed in seeds
+            ]
+
+    def _step_random(self, active):
+        """
+        Return the random numbers of the current step, if seeded.
+
+        Args:
+        - active: Indices of the realizations that are evolved
+        """
+        if self.randoms is None:
+            return None
+        return StepRandom([self.randoms[run] for run in active], self.steps)
+
+    def step(self):
+        """Evolve all realizations to the next step."""
+        self.ca.evolution_rule.update_wind(self.steps)
+        self.state = self.ca.evolution_rule.evolve_grid(
+            self.state, rng=self._step_random(range(len(self.state)))
+        )
+        self.steps += 1
+
+    def burning_cells(self):
+        """Return the amount of burning cells per realization."""
+        return np.count_nonzero(self.state == 1, axis=(1, 2))
+
+    def burned_cells(self):
+        """Return the amount of burned out cells per realization."""
+        return np.count_nonzero(self.state == 2, axis=(1, 2))
+
+    def scar_sizes(self, stop=None):
+        """
+        Monitor the size of the burn scars of all realizations over time.
+
+        Returns the series of burned cell counts per realization, each as
+        Simulation.scar_size would return it, and keeps why each stopped in
+        reasons. Realizations that are done are dropped from the stack at
+        once, so they no longer cost anything.
+
+        Args:
+        - stop: StopCriteria of the realizations, until the fire is out if
+                None. The wall-clock time counts for all of them at once.
+        """
+        if stop is None:
+            stop = StopCriteria()
+        stop.start()
+
+        burning, burned = self.burning_cells(), self.burned_cells()
+        scars = [[count] for count in burned]
+
+        # the realizations that are still evolving, and their states
+        active = np.arange(len(self.state))
+        state = self.state
+
+        while True:
+            reasons = stop.reasons(state, burning, burned, self.steps)
+            done = np.not_equal(reasons, None)
+            if done.any():
+                for run, reason in zip(active[done], reasons[done]):
+                    self.reasons[run] = reason
+                self.state[active[done]] = state[done]
+                state, active = state[~done], active[~done]
+                burning, burned = burning[~done], burned[~done]
+            if not len(active):
+                break
+
+            self.ca.evolution_rule.update_wind(self.steps)
+            state = self.ca.evolution_rule.evolve_grid(
+                state, rng=self._step_random(active)
+            )
+            self.steps += 1
+
+            burning = np.count_nonzero(state == 1, axis=(1, 2))
+            burned = np.count_nonzero(state == 2, axis=(1, 2))
+            for run, count in zip(active, burned):
+                scars[run].append(count)
+
+        return [np.array(scar) for scar in scars]
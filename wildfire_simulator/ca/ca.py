@@ -1,90 +1,617 @@
 """Defines a CA within the context of the simulation."""
 
-import json
+import copy
 import numpy as np
 from matplotlib.colors import ListedColormap
-from .cell import Cell
+from . import gridfile
+from .cell import Cell, CellView
+from .gridfile import CAGridInvalidError
 from .evolution_rules import NNEvolutionRule
+from .instrument import Instrument
+from .landscape import GridView, Landscape
+from .rng import CellRandom
 from random import randint
 
 
 class CA:
     """Defines a CA withing the context of the wildfire simulation."""
 
-    def __init__(self, grid, evolution_rule, max_alt):
+    # RGB colors of the cells, indexed by state, vegetation and density code
+    palette = Cell.palette()
+
+    def __init__(self, grid, evolution_rule, max_alt, frontier=False,
+                 arrays=None, seed=None):
         """
         Construct a CA.
 
         Args:
-        - grid: The grid containing the cells
+        - grid: The grid containing the cells, only used to extract the
+                arrays from
         - evolution rule: Defines how the ca evolves over time
         - max_alt: Maximum altitude in the CA
+        - frontier: Only evolve the burning cells and their neighbors each
+                    step, instead of the whole grid
+        - arrays: The state, altitude, vegetation code and density code
+                  arrays of the cells, extracted from the grid when None
+        - seed: Seed of the random numbers, see CA.seed. The random and
+                numpy.random modules are used when None.
         """
-        self.grid = grid
         self.evolution_rule = evolution_rule
         self.max_alt = max_alt
+        self.frontier = frontier
+
+        # typed arrays of the cell attributes: the state, and the landscape
+        # which never changes
+        if arrays is None:
+            arrays = CA.grid_to_arrays(grid)
+        self.state = arrays[0]
+        self.landscape = Landscape(*arrays[1:])
+
+        # running counts of the cells per state, and of the burned out cells
+        # per vegetation type
+        self.counts = np.bincount(self.state.ravel(), minlength=3)
+        self.burned_veg = np.bincount(
+            self.veg[self.state == 2], minlength=len(Cell.vegetations)
+        )
+
+        # positions (ys, xs) of the burning cells, tracked when stepping the
+        # fire front only
+        self._burning = None
+
+        # padded current and next state buffers, see CA._state_buffers
+        self._buffers = None
+
+        # measures the steps when set, see CA.observe
+        self.instrument = None
+
+        # the grid file the landscape was read from, see CA.from_gridfile
+        self.grid_filename = None
+
+        # long range spread of the fire by embers, like an EmberSpotting,
+        # disabled when None
+        self.spotting = None
+
+        # the amount of steps taken, and the random numbers of the run
+        self.steps = 0
+        self.random = None
+        if seed is not None:
+            self.seed(seed)
+
+        # let the evolution rule precompute what it needs from the landscape
+        if hasattr(evolution_rule, 'prepare'):
+            evolution_rule.prepare(self)
+
+    @property
+    def grid(self):
+        """Return the grid containing the cells, as a view of the CA."""
+        return GridView(self)
+
+    @property
+    def shape(self):
+        """Return the amount of rows and columns of the grid."""
+        return self.state.shape
+
+    @property
+    def border(self):
+        """Return the width of the border the states are padded with."""
+        return getattr(self.evolution_rule, 'radius', 1)
+
+    @property
+    def alt(self):
+        """Return the altitudes of the cells in meters."""
+        return self.landscape.alt
+
+    @property
+    def veg(self):
+        """Return the vegetation codes of the cells."""
+        return self.landscape.veg
+
+    @property
+    def dens(self):
+        """Return the density codes of the cells."""
+        return self.landscape.dens
+
+    def copy(self):
+        """
+        Create a copy of the CA that evolves independently of it.
+
+        The landscape and the prepared evolution rule are shared with the
+        copy, only the state of the CA is copied. A seeded copy draws the
+        same random numbers, unless it's seeded again.
+        """
+        ca = copy.copy(self)
+        ca.state = self.state.copy()
+        ca.counts = self.counts.copy()
+        ca.burned_veg = self.burned_veg.copy()
+        ca._burning = None
+        ca.instrument = None
+
+        return ca
+
+    def seed(self, seed):
+        """
+        Seed the random numbers of the run.
+
+        A seeded CA draws counter-based random numbers for each cell at each
+        step (see CellRandom), so runs with the same seed give bit-identical
+        results whether the CA evolves the whole grid or the fire front.
+        Rules that only evolve cells keep using the random module.
+
+        Args:
+        - seed: An int, numpy SeedSequence or Generator, or a CellRandom
+        """
+        if not isinstance(seed, CellRandom):
+            seed = CellRandom(seed)
+        self.random = seed
+
+    def _step_random(self):
+        """Return the random numbers of the current step, if seeded."""
+        if self.random is None:
+            return None
+        return self.random.for_step(self.steps)
+
+    def observe(self, observer):
+        """
+        Call an observer after each step, with the metrics of the step.
+
+        This instruments the steps of the CA, see Instrument for the metrics.
+        Returns the instrument.
+
+        Args:
+        - observer: Function called as observer(ca, metrics) after each step
+        """
+        if self.instrument is None:
+            self.instrument = Instrument()
+        self.instrument.add_observer(observer)
+
+        return self.instrument
 
     def step(self):
         """Evolve the CA to the next step."""
 
-        # for the purpose of creating a grid with proper borders, we pad it
-        # with non-flammable cells
-        grid = np.pad(self.grid, 1, 'constant', constant_values=Cell(3))
-
-        # make a new grid to store our evolved cells
-        new_grid = []
-        height, width = grid.shape
-        for y in range(1, height-1):
-            row = []
-            for x in range(1, width-1):
-                # store our evolved cell
+        instrument = self.instrument
+        if instrument is None:
+            self._step()
+            self.steps += 1
+            return
+
+        previous = self.state.copy()
+        instrument.start()
+        evaluated = self._step(instrument)
+        self.steps += 1
+        instrument.finish(
+            self, previous, evaluated,
+            getattr(self.evolution_rule, 'offsets', NNEvolutionRule.offsets)
+        )
+
+    def _step(self, instrument=None):
+        """
+        Evolve the CA to the next step.
+
+        Returns the amount of cells that the evolution rule evolved.
+
+        Args:
+        - instrument: Instrument to mark the phases of the step with
+        """
+        # the wind may change over time, see NNEvolutionRule.update_wind
+        if hasattr(self.evolution_rule, 'update_wind'):
+            self.evolution_rule.update_wind(self.steps)
+
+        # embers fly from the cells that burn now, and ignite the cells they
+        # land on in the next step like their neighbors do
+        landings = None
+        if self.spotting is not None:
+            landings = self.spotting.landings(self, self._step_random())
+            if instrument is not None:
+                instrument.mark('spotting')
+
+        evaluated = self._evolve(instrument)
+        if landings is not None:
+            self._ignite(*landings)
+
+        return evaluated
+
+    def _evolve(self, instrument=None):
+        """
+        Evolve the states of the CA with the evolution rule.
+
+        Returns the amount of cells that the evolution rule evolved.
+
+        Args:
+        - instrument: Instrument to mark the phases of the step with
+        """
+        if self.frontier:
+            return self.step_frontier(instrument)
+
+        # the burning cells are only tracked while stepping the fire front
+        self._burning = None
+
+        # vectorized rules evolve the state array of the whole grid at once
+        if getattr(self.evolution_rule, 'vectorized', False) \
+                and self._evolves_with('evolve_padded'):
+            current, new = self._state_buffers()
+            self.evolution_rule.evolve_padded(
+                current, self._inside(new), instrument, self._step_random()
+            )
+            return self._swap_state_buffers(instrument)
+
+        # rules that evolve states instead of cells only need to visit the
+        # cells that can change state, in the same order as all cells
+        if self._evolves_with('next_state'):
+            current, new = self._state_buffers()
+            np.copyto(new, current)
+
+            ys, xs = np.nonzero(self._changeable(current))
+            if instrument is not None:
+                instrument.mark('front')
+
+            next_state = self.evolution_rule.next_state
+            rng = self._step_random()
+            r = self.border
+            for y, x in zip((ys + r).tolist(), (xs + r).tolist()):
+                new[y, x] = next_state(current, y, x, rng)
+            if instrument is not None:
+                instrument.mark('evolve')
+
+            self._swap_state_buffers(instrument)
+            return len(ys)
+
+        # other rules evolve cells, which are views of the CA, so only the
+        # states are stored
+        current, new = self._state_buffers()
+        height, width = self.state.shape
+        r = self.border
+        for y in range(height):
+            for x in range(width):
                 cell = self.evolution_rule.evolve(
-                    grid[y, x], grid[y-1:y+2, x-1:x+2]
+                    CellView(self, y, x), self.neighborhood(y, x)
                 )
-                row.append(cell)
+                new[y+r, x+r] = cell.state
+
+        if instrument is not None:
+            instrument.mark('evolve')
+
+        return self._swap_state_buffers(instrument)
+
+    def _evolves_with(self, name):
+        """
+        Return whether to evolve with a method of the rule instead of evolve.
+
+        Rules that evolve states or whole arrays are much faster than those
+        that evolve cells, but a rule that overrides evolve after the method
+        was defined, like a subclass of NNEvolutionRule changing only
+        evolve, has to be evolved with its own evolve.
+
+        Args:
+        - name: Name of the method, like 'next_state'
+        """
+        mro = type(self.evolution_rule).__mro__
+        defined = [i for i, cls in enumerate(mro) if name in vars(cls)]
+        if not defined:
+            return hasattr(self.evolution_rule, name)
+
+        evolve = [i for i, cls in enumerate(mro) if 'evolve' in vars(cls)]
+        return not evolve or defined[0] <= evolve[0]
+
+    def _ignite(self, ys, xs):
+        """
+        Ignite the cells of the CA that are unburnt.
+
+        Args:
+        - ys: Rows of the cells
+        - xs: Columns of the cells
+        """
+        width = self.state.shape[1]
+        cells = np.unique(ys * width + xs)
+        ys, xs = cells // width, cells % width
+        unburnt = self.state[ys, xs] == 0
+        ys, xs = ys[unburnt], xs[unburnt]
+
+        states = np.ones(len(ys), dtype=np.uint8)
+        self._count(self.state[ys, xs], states, self.veg[ys, xs])
+        self.state[ys, xs] = states
+        if self._burning is not None:
+            self._burning = (
+                np.concatenate([self._burning[0], ys]),
+                np.concatenate([self._burning[1], xs])
+            )
 
-            # store our new row
-            new_grid.append(row)
+    def _state_buffers(self):
+        """
+        Return the current and the next state buffer of the CA.
 
-        # set our newly generated grid as our current one
-        self.grid = np.array(new_grid)
+        The buffers hold the states padded with a border of non-flammable
+        cells, as wide as the stencil of the evolution rule reaches, and the
+        state of the CA is the inside of the current one. They are made when
+        the state array isn't a buffer yet.
+        """
+        if self._buffers is None or self.state.base is not self._buffers[0]:
+            height, width = self.state.shape
+            r = self.border
+            self._buffers = [
+                np.full((height + 2 * r, width + 2 * r), 3, dtype=np.uint8)
+                for _ in range(2)
+            ]
+            self._inside(self._buffers[0])[...] = self.state
+            self.state = self._inside(self._buffers[0])
+
+        return self._buffers
+
+    def _inside(self, buffer):
+        """
+        Return the states of the grid in a state buffer, without the border.
+
+        Args:
+        - buffer: One of the padded state buffers
+        """
+        r = self.border
+        return buffer[r:-r, r:-r]
+
+    def _swap_state_buffers(self, instrument=None):
+        """
+        Make the next state buffer the current one.
+
+        Returns the amount of cells of the grid.
+
+        Args:
+        - instrument: Instrument to mark the phases of the step with
+        """
+        current, new = self._buffers
+        self._update_state(self._inside(new))
+        self._buffers = [new, current]
+        if instrument is not None:
+            instrument.mark('count')
+
+        return self.state.size
+
+    def _changeable(self, padded):
+        """
+        Return which cells can change state in the next step.
+
+        These are the burning cells, and the unburnt cells with a burning
+        neighbor.
+
+        Args:
+        - padded: States of the cells, padded with non-flammable cells
+        """
+        height, width = self.state.shape
+        burning = padded == 1
+        offsets = getattr(
+            self.evolution_rule, 'offsets', NNEvolutionRule.offsets
+        )
+
+        r = self.border
+        near_fire = np.zeros((height, width), dtype=bool)
+        for dy, dx in offsets:
+            near_fire |= burning[r+dy:height+r+dy, r+dx:width+r+dx]
+
+        state = self._inside(padded)
+        return (state == 1) | ((state == 0) & near_fire)
+
+    def step_frontier(self, instrument=None):
+        """
+        Evolve the CA to the next step, only visiting the fire front.
+
+        Only burning cells and the unburnt cells next to them can change
+        state, so the cost of this step scales with the length of the fire
+        front rather than the size of the grid. Returns the amount of cells
+        that the evolution rule evolved.
+
+        Args:
+        - instrument: Instrument to mark the phases of the step with
+        """
+        height, width = self.state.shape
+        if self._burning is None:
+            self._burning = np.nonzero(self.state == 1)
+
+        # find the unburnt neighbors of the burning cells
+        ys, xs = self._burning
+        offsets = getattr(
+            self.evolution_rule, 'offsets', NNEvolutionRule.offsets
+        )
+        nys = np.concatenate([ys + dy for dy, dx in offsets])
+        nxs = np.concatenate([xs + dx for dy, dx in offsets])
+        inside = (nys >= 0) & (nys < height) & (nxs >= 0) & (nxs < width)
+        nys, nxs = nys[inside], nxs[inside]
+        unburnt = self.state[nys, nxs] == 0
+        neighbors = np.unique(nys[unburnt] * width + nxs[unburnt])
+
+        # the cells of the fire front
+        ys = np.concatenate([ys, neighbors // width])
+        xs = np.concatenate([xs, neighbors % width])
+        if instrument is not None:
+            instrument.mark('front')
+
+        if getattr(self.evolution_rule, 'vectorized', False) \
+                and self._evolves_with('evolve_cells'):
+            states = self.evolution_rule.evolve_cells(
+                self.state, ys, xs, instrument, self._step_random()
+            )
+        elif self._evolves_with('next_state'):
+            # all cells are evolved before any is stored, so they all see
+            # the states of the current step
+            current, _ = self._state_buffers()
+            next_state = self.evolution_rule.next_state
+            rng = self._step_random()
+            r = self.border
+            states = [
+                next_state(current, y, x, rng)
+                for y, x in zip((ys + r).tolist(), (xs + r).tolist())
+            ]
+            if instrument is not None:
+                instrument.mark('evolve')
+        else:
+            # evolve all cells before storing any, as they all have to see
+            # the grid of the current step
+            states = [
+                self.evolution_rule.evolve(
+                    CellView(self, y, x), self.neighborhood(y, x)
+                ).state
+                for y, x in zip(ys.tolist(), xs.tolist())
+            ]
+            if instrument is not None:
+                instrument.mark('evolve')
+
+        states = np.asarray(states, dtype=np.uint8)
+        self._count(self.state[ys, xs], states, self.veg[ys, xs])
+        self.state[ys, xs] = states
+
+        burning = states == 1
+        self._burning = ys[burning], xs[burning]
+        if instrument is not None:
+            instrument.mark('count')
+
+        return len(ys)
+
+    def _update_state(self, state):
+        """
+        Replace the state array, counting the cells that changed state.
+
+        Args:
+        - state: The new state array
+        """
+        changed = self.state != state
+        self._count(self.state[changed], state[changed], self.veg[changed])
+        self.state = state
+
+    def _count(self, old_states, new_states, vegs):
+        """
+        Update the running counts with the cells that changed state.
+
+        Args:
+        - old_states: Previous states of the cells
+        - new_states: New states of the cells
+        - vegs: Vegetation codes of the cells
+        """
+        self.counts -= np.bincount(old_states, minlength=3)[:3]
+        self.counts += np.bincount(new_states, minlength=3)[:3]
+
+        burned_out = (new_states == 2) & (old_states != 2)
+        self.burned_veg += np.bincount(
+            vegs[burned_out], minlength=len(Cell.vegetations)
+        )
+
+    def unburnt_cells(self):
+        """Return the amount of cells that have not burned."""
+        return int(self.counts[0])
+
+    def burning_cells(self):
+        """Return the amount of cells that are burning."""
+        return int(self.counts[1])
+
+    def burned_cells(self):
+        """Return the amount of cells that have burned out."""
+        return int(self.counts[2])
+
+    def set_ignitions(self, ignitions):
+        """
+        Replace the burning cells of the CA by other ignition points.
+
+        The cells that were burning become unburnt again.
+
+        Args:
+        - ignitions: Rows and columns (y, x) of the cells to ignite
+        """
+        ys, xs = np.array(ignitions, dtype=np.intp).reshape(-1, 2).T
+        height, width = self.state.shape
+        if not ((ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)).all():
+            raise ValueError("Ignition points should be inside of the grid")
+        if (self.state[ys, xs] == 2).any():
+            raise ValueError("Burned out cells can't ignite")
+
+        self.state[self.state == 1] = 0
+        self.state[ys, xs] = 1
+        self.counts = np.bincount(self.state.ravel(), minlength=3)
+        self._burning = None
+
+    def burning_positions(self):
+        """Return the rows and columns (ys, xs) of the burning cells."""
+        if self._burning is not None:
+            return self._burning
+        return np.nonzero(self.state == 1)
+
+    def burned_by_vegetation(self):
+        """Return the amount of burned out cells per vegetation type."""
+        return dict(zip(Cell.vegetations, self.burned_veg.tolist()))
+
+    def neighborhood(self, y, x):
+        """
+        Return the neighborhood of a cell, as far as the stencil reaches.
+
+        This is the 3x3 neighborhood for the default stencil. Neighbors
+        outside of the grid are non-flammable cells.
+
+        Args:
+        - y: Row of the cell
+        - x: Column of the cell
+        """
+        r = self.border
+        return GridView(self, y - r, x - r, (2 * r + 1, 2 * r + 1))
 
     def grid_as_pixels(self):
         """Return the CA grid as RGB values representing the states."""
-        return np.array(
-            [[cell.get_color() for cell in row] for row in self.grid]
-        )
+        return self.as_rgb() / 255
+
+    def as_rgb(self):
+        """Return the CA grid as an RGB image in bytes."""
+        return CA.palette[self.state, self.veg, self.dens]
 
     def get_altitudes(self):
         """Return the altitudes of the cells."""
-        return np.array([[cell.alt for cell in row] for row in self.grid])
+        return self.alt
 
-    def from_gridfile(filename, evolution_rule=NNEvolutionRule):
+    def from_gridfile(filename, evolution_rule=NNEvolutionRule,
+                      frontier=False, seed=None, stencil=None):
         """
-        Create a CA using a grid file (JSON).
+        Create a CA using a grid file (JSON or binary).
 
         Args:
         - filename: Path to the file the read the CA grid from
         - evolution_rule: Class to use as the evolution rule
+        - frontier: Only evolve the fire front each step
+        - seed: Seed of the random numbers, see CA.seed
+        - stencil: Stencil of the neighbors of the evolution rule, the
+                   default of the rule if None
         """
-        with open(filename) as f:
-            gridconf = json.loads(f.read())
+        if gridfile.is_binary(filename):
+            # the landscape stays memory mapped, only the state is copied
+            # as it changes
+            conf, state, alt, veg, dens = gridfile.read_binary(filename)
+            state = np.array(state)
+        else:
+            # the JSON is read row by row, straight into typed arrays
+            conf, state, alt, veg, dens = gridfile.read_json(filename)
+
+        kwargs = {} if stencil is None else {'stencil': stencil}
+        er = evolution_rule(
+            p0=conf['p0'], wind_dir=conf['wind_dir'],
+            wind_speed=conf['wind_speed'], **kwargs
+        )
 
-            # read our configuration variables from the JSON
-            p0 = gridconf['p0']
-            wind_dir = gridconf['wind_dir']
-            wind_speed = gridconf['wind_speed']
-            gridraw = gridconf['grid']
-            max_alt = gridconf['max_alt']
+        # return our newly generated CA
+        ca = CA(
+            None, er, conf['max_alt'], frontier, (state, alt, veg, dens),
+            seed
+        )
+        ca.grid_filename = filename
+        return ca
 
-            # build our grid with the configuration variables
-            grid = CA.build_grid(gridraw, max_alt)
-            er = evolution_rule(
-                p0=p0, wind_dir=wind_dir, wind_speed=wind_speed
-            )
+    def to_binary_gridfile(self, filename):
+        """
+        Save the CA as a grid file in the binary format.
 
-            # return our newly generated CA
-            return CA(grid, er, max_alt)
+        Args:
+        - filename: Path to the file to write the CA grid to
+        """
+        conf = {
+            'p0': self.evolution_rule.p0,
+            'wind_dir': self.evolution_rule.wind_dir,
+            'wind_speed': self.evolution_rule.wind_speed,
+            'max_alt': self.max_alt,
+        }
+        gridfile.write_binary(
+            filename, conf, self.state, self.alt, self.veg, self.dens
+        )
 
     def build_grid(rawgrid, max_alt):
         """
@@ -122,6 +649,32 @@ class CA:
         except Exception as e:
             raise ValueError("Invalid grid file") from e
 
+    def grid_to_arrays(grid):
+        """
+        Extract typed arrays of the cell attributes from a grid.
+
+        Returns the state, altitude, vegetation code and density code arrays.
+
+        Args:
+        - grid: The grid containing the cells
+        """
+        state = np.array(
+            [[cell.state for cell in row] for row in grid], dtype=np.uint8
+        )
+        alt = np.array(
+            [[cell.alt for cell in row] for row in grid], dtype=np.float32
+        )
+        veg = np.array(
+            [[Cell.vegetations.index(cell.veg) for cell in row]
+             for row in grid], dtype=np.uint8
+        )
+        dens = np.array(
+            [[Cell.densities.index(cell.dens) for cell in row]
+             for row in grid], dtype=np.uint8
+        )
+
+        return state, alt, veg, dens
+
     def validate(grid):
         """
         Validate whether a CA grid is valid.
@@ -141,8 +694,3 @@ class CA:
 
         if not all(len(line) == len(grid[0]) for line in grid):
             raise CAGridInvalidError("Grid should be rectangular")
-
-
-class CAGridInvalidError(ValueError):
-    """Raised when a CA grid is invalid."""
-    pass
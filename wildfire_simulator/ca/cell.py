@@ -1,5 +1,7 @@
 """Contains the class defining cells in the CA."""
 
+import numpy as np
+
 
 class Cell:
     """
@@ -36,9 +38,17 @@ class Cell:
     nov: No vegetation
     """
 
+    # Cells only have these attributes, which keeps them small
+    __slots__ = ('state', 'pos', 'alt', 'veg', 'dens')
+
     # Diameter of a cell
     diameter = 100
 
+    # Vegetation types and densities, indexed by the integer codes used in
+    # the array representation of the grid
+    vegetations = ('nov', 'agr', 'for', 'shr')
+    densities = ('nov', 'spa', 'nor', 'den')
+
     def __init__(self, state, pos=(-1, -1), alt=0.5, veg='for', dens='nor'):
         """Construct the Cell."""
         self.state = state
@@ -99,6 +109,25 @@ class Cell:
 
         return color
 
+    def palette():
+        """
+        Return the colors of all kinds of cells, in an RGB lookup table.
+
+        The table is indexed by the state, vegetation code and density code of
+        a cell, and holds the color of get_color in bytes. It covers all the
+        states but the padding state 3.
+        """
+        palette = np.zeros(
+            (3, len(Cell.vegetations), len(Cell.densities), 3), dtype=np.uint8
+        )
+        for state in range(3):
+            for v, veg in enumerate(Cell.vegetations):
+                for d, dens in enumerate(Cell.densities):
+                    color = Cell(state, veg=veg, dens=dens).get_color()
+                    palette[state, v, d] = np.round(np.array(color) * 255)
+
+        return palette
+
     def density_as_int(self):
         """Return the vegetation density as an integer."""
 
@@ -110,3 +139,78 @@ class Cell:
             return 85
         else:
             return 0
+
+
+class CellView(Cell):
+    """
+    View of a cell of a CA, behaving like a Cell.
+
+    The view reads the attributes of the cell from the state array and the
+    landscape of the CA when they're used, so the CA doesn't have to keep a
+    Cell per cell. Setting the state of a view sets it in the CA. Copying a
+    view gives a Cell. Views of cells outside the grid are non-flammable
+    cells, with the other attributes of Cell(3).
+    """
+
+    __slots__ = ('ca', 'y', 'x')
+
+    # Attributes of cells outside of the grid
+    outside = Cell(3)
+
+    def __init__(self, ca, y, x):
+        """
+        Construct the view.
+
+        Params:
+        - ca: The CA of the cell
+        - y: Row of the cell
+        - x: Column of the cell
+        """
+        self.ca = ca
+        self.y = y
+        self.x = x
+
+    def inside(self):
+        """Return whether the cell is inside of the grid of the CA."""
+        height, width = self.ca.state.shape
+        return 0 <= self.y < height and 0 <= self.x < width
+
+    @property
+    def state(self):
+        """State of the cell."""
+        if not self.inside():
+            return self.outside.state
+        return int(self.ca.state[self.y, self.x])
+
+    @state.setter
+    def state(self, state):
+        """Set the state of the cell in the CA."""
+        self.ca.state[self.y, self.x] = state
+
+    @property
+    def pos(self):
+        """Position of the cell as an (x, y)-coordinate, counting from 1."""
+        if not self.inside():
+            return self.outside.pos
+        return self.x + 1, self.y + 1
+
+    @property
+    def alt(self):
+        """Altitude of the cell in meters."""
+        if not self.inside():
+            return self.outside.alt
+        return float(self.ca.landscape.alt[self.y, self.x])
+
+    @property
+    def veg(self):
+        """Vegetation type of the cell."""
+        if not self.inside():
+            return self.outside.veg
+        return Cell.vegetations[self.ca.landscape.veg[self.y, self.x]]
+
+    @property
+    def dens(self):
+        """Vegetation density of the cell."""
+        if not self.inside():
+            return self.outside.dens
+        return Cell.densities[self.ca.landscape.dens[self.y, self.x]]
@@ -0,0 +1,272 @@
+"""Defines checkpoints of a CA, to resume runs that were stopped."""
+
+import json
+import numpy as np
+import os
+import random
+import time
+from . import evolution_rules
+from .ca import CA
+from .rng import CellRandom
+from .stencil import STENCILS
+from .tiled import TiledCA
+
+
+# Version of the checkpoint format, increased when it changes
+VERSION = 1
+
+
+class CheckpointError(ValueError):
+    """Raised when a checkpoint can't be resumed."""
+
+    pass
+
+
+def save_checkpoint(ca, filename, **arrays):
+    """
+    Save the dynamic state of a CA to a checkpoint file.
+
+    Only what changes during a run is saved: the states, the amount of steps,
+    the running counts and the state of the random numbers. The landscape is
+    referenced by the path of its grid file, so checkpoints are small and
+    quick to write. The file is replaced atomically, so a run stopped while
+    saving still leaves the previous checkpoint.
+
+    Params:
+    - ca: A CA read from a grid file, or a TiledCA
+    - filename: Path to the checkpoint file
+    - arrays: Other arrays to save with the checkpoint, like the results of
+              the run so far
+    """
+    meta = {
+        'version': VERSION,
+        'steps': ca.steps,
+    }
+    data = {
+        'counts': ca.counts,
+        'burned_veg': ca.burned_veg,
+    }
+
+    if isinstance(ca, TiledCA):
+        meta['grid'] = os.path.abspath(ca.directory)
+        meta['rule'] = ca.evolution_rule.__name__
+        meta['tiles'] = [list(tile) for tile in ca._states]
+        # in the order the tiles step, which unseeded runs depend on
+        meta['loaded'] = [list(tile) for tile in ca._cas]
+        for tile, state in ca._states.items():
+            data['tile_{}_{}'.format(*tile)] = state
+    else:
+        if ca.grid_filename is None:
+            raise ValueError("Only CAs read from a grid file can be saved")
+
+        meta['grid'] = os.path.abspath(ca.grid_filename)
+        meta['rule'] = type(ca.evolution_rule).__name__
+        meta['frontier'] = ca.frontier
+        if hasattr(ca.evolution_rule, 'stencil'):
+            meta['stencil'] = ca.evolution_rule.stencil.name
+        data['state'] = ca.state
+
+    if ca.random is not None:
+        seed = ca.random.seed_sequence
+        meta['seed'] = {
+            'entropy': seed.entropy,
+            'spawn_key': list(seed.spawn_key),
+            'pool_size': seed.pool_size,
+            'origin': list(ca.random.origin),
+        }
+    else:
+        # unseeded runs draw from the global generators, whose whole state
+        # is needed to continue the same run
+        _, keys, gauss = random.getstate()
+        data['py_random'] = np.array(keys, dtype=np.uint32)
+        meta['py_gauss'] = gauss
+
+        _, keys, pos, has_gauss, gauss = np.random.get_state()
+        data['np_random'] = keys
+        meta['np_random'] = [pos, has_gauss, gauss]
+
+    for name in arrays:
+        data['extra_' + name] = arrays[name]
+    data['meta'] = np.array(json.dumps(meta))
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez_compressed(f, **data)
+    os.replace(temporary, filename)
+
+
+def load_checkpoint(filename, evolution_rule=None):
+    """
+    Resume a CA from a checkpoint file.
+
+    Returns the CA, and a dict of the other arrays saved with the checkpoint.
+    The landscape is read from the grid file the checkpoint references. The
+    global random number generators are restored too, if the run wasn't
+    seeded.
+
+    Params:
+    - filename: Path to the checkpoint file
+    - evolution_rule: Class to use as the evolution rule, looked up by the
+                      name in the checkpoint when None
+    """
+    with np.load(filename) as f:
+        data = dict(f)
+    meta = json.loads(str(data['meta']))
+
+    if meta['version'] != VERSION:
+        raise CheckpointError(
+            "Unsupported checkpoint version {}".format(meta['version'])
+        )
+    if not os.path.exists(meta['grid']):
+        raise CheckpointError(
+            "Grid file {} of the checkpoint not found".format(meta['grid'])
+        )
+
+    if evolution_rule is None:
+        evolution_rule = getattr(evolution_rules, meta['rule'], None)
+        if evolution_rule is None:
+            raise CheckpointError(
+                "Unknown evolution rule {}".format(meta['rule'])
+            )
+
+    rng = None
+    if 'seed' in meta:
+        seed = meta['seed']
+        rng = CellRandom(np.random.SeedSequence(
+            seed['entropy'], spawn_key=seed['spawn_key'],
+            pool_size=seed['pool_size']
+        ))
+        rng.origin = tuple(seed['origin'])
+
+    if 'tiles' in meta:
+        ca = _load_tiled(meta, data, evolution_rule, rng)
+    else:
+        stencil = None
+        if 'stencil' in meta:
+            if meta['stencil'] not in STENCILS:
+                raise CheckpointError(
+                    "Unknown stencil {}".format(meta['stencil'])
+                )
+            stencil = STENCILS[meta['stencil']]
+
+        ca = CA.from_gridfile(
+            meta['grid'], evolution_rule, meta['frontier'], stencil=stencil
+        )
+        if not ca.state.shape == data['state'].shape:
+            raise CheckpointError(
+                "The checkpoint doesn't match the shape of its grid file"
+            )
+
+        ca.state = data['state']
+        ca.steps = meta['steps']
+        ca.random = rng
+
+    ca.counts = data['counts']
+    ca.burned_veg = data['burned_veg']
+
+    if rng is None:
+        random.setstate(
+            (3, tuple(data['py_random'].tolist()), meta['py_gauss'])
+        )
+        np.random.set_state(('MT19937', data['np_random'], *meta['np_random']))
+
+    arrays = {
+        name[len('extra_'):]: array
+        for name, array in data.items() if name.startswith('extra_')
+    }
+    return ca, arrays
+
+
+def _load_tiled(meta, data, evolution_rule, rng):
+    """
+    Resume a TiledCA from the contents of a checkpoint.
+
+    Params:
+    - meta: The metadata of the checkpoint
+    - data: The arrays of the checkpoint
+    - evolution_rule: Class to use as the evolution rule
+    - rng: The random numbers of the run, None if it wasn't seeded
+    """
+    ca = TiledCA(meta['grid'], evolution_rule)
+    ca.steps = meta['steps']
+    if rng is not None:
+        ca.seed(rng)
+
+    ca._states = {
+        tuple(tile): data['tile_{}_{}'.format(*tile)]
+        for tile in meta['tiles']
+    }
+    ca._cas = {}
+    for tile in meta['loaded']:
+        ca.load(tuple(tile))
+
+    return ca
+
+
+class Checkpointer:
+    """
+    Saves checkpoints of a CA during a run, every so many steps or seconds.
+
+    Call it after every step of the CA. A checkpoint is saved when either
+    interval has passed since the previous one. To prepare for a checkpoint,
+    like flushing a history, check whether one is due and save it apart.
+    """
+
+    def __init__(self, filename, steps=None, seconds=None):
+        """
+        Construct the checkpointer.
+
+        Params:
+        - filename: Path to the checkpoint file, overwritten every time
+        - steps: Amount of steps between checkpoints
+        - seconds: Amount of seconds between checkpoints
+        """
+        if steps is None and seconds is None:
+            raise ValueError("Checkpoints need an interval of steps or time")
+        if steps is not None and steps < 1:
+            raise ValueError("Checkpoints need to be at least one step apart")
+
+        self.filename = filename
+        self.steps = steps
+        self.seconds = seconds
+        self.saves = 0
+        self._last = time.monotonic()
+
+    def __call__(self, ca, **arrays):
+        """
+        Save a checkpoint of the CA if one is due.
+
+        Returns whether a checkpoint was saved.
+
+        Params:
+        - ca: The CA after a step
+        - arrays: Other arrays to save with the checkpoint
+        """
+        if not self.due(ca):
+            return False
+
+        self.save(ca, **arrays)
+        return True
+
+    def due(self, ca):
+        """
+        Return whether a checkpoint is due.
+
+        Params:
+        - ca: The CA after a step
+        """
+        return self.steps is not None and ca.steps % self.steps == 0 \
+            or self.seconds is not None \
+            and time.monotonic() - self._last >= self.seconds
+
+    def save(self, ca, **arrays):
+        """
+        Save a checkpoint of the CA.
+
+        Params:
+        - ca: The CA after a step
+        - arrays: Other arrays to save with the checkpoint
+        """
+        save_checkpoint(ca, self.filename, **arrays)
+        self.saves += 1
+        self._last = time.monotonic()
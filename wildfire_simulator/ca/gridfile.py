@@ -0,0 +1,518 @@
+"""
+Reads and writes grid files.
+
+JSON grid files are read incrementally, a row of cells at a time, straight
+into typed arrays. The parsed document is never held in memory as a whole.
+
+A binary grid file starts with a fixed size header holding the
+configuration of the grid, followed by the cell attributes as contiguous
+arrays, each in row-major order:
+- altitude in meters (float32)
+- vegetation code (uint8), indexing Cell.vegetations
+- density code (uint8), indexing Cell.densities
+- state (uint8)
+
+The arrays are memory mapped when reading, so opening a grid is fast
+regardless of its size, and processes reading the same file share its pages.
+"""
+
+import json
+import os
+import numpy as np
+from .cell import Cell
+
+
+# Marks the start of a binary grid file
+MAGIC = b'WFGRID'
+
+# Version of the binary grid file format
+VERSION = 1
+
+# Layout of the header, padded to 64 bytes to align the arrays
+HEADER = np.dtype([
+    ('magic', 'S6'),
+    ('version', '<u2'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('p0', '<f8'),
+    ('wind_dir', '<f8', (2,)),
+    ('wind_speed', '<f8'),
+    ('max_alt', '<f8'),
+    ('reserved', 'V8'),
+])
+
+
+# Codes of the vegetation types and densities in JSON grid files
+VEG_CODES = {veg: code for code, veg in enumerate(Cell.vegetations)}
+DENS_CODES = {dens: code for code, dens in enumerate(Cell.densities)}
+
+
+class CAGridInvalidError(ValueError):
+    """Raised when a CA grid is invalid."""
+
+    pass
+
+
+class JSONReader:
+    """Reads the values of a JSON document one by one from a file."""
+
+    def __init__(self, f, chunk_size=1 << 20):
+        """
+        Construct the JSON reader.
+
+        Params:
+        - f: The file (in text mode) to read from
+        - chunk_size: Minimal amount of characters to read at once
+        """
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+
+    def tell(self):
+        """Return the position of the reader in the file, in characters."""
+        return self.offset + self.pos
+
+    def read(self):
+        """Read more of the file into the buffer."""
+        # read at least as much as we have, so values that span many chunks
+        # don't get parsed over and over again
+        chunk = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Return the next character that is not whitespace, or '' at EOF."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos+1]
+
+            self.read()
+
+    def expect(self, chars):
+        """
+        Read one of the given structural characters.
+
+        Returns the character that was read.
+
+        Params:
+        - chars: The characters that are allowed here
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise CAGridInvalidError(
+                "Invalid grid file: expected one of '{}' at character {}"
+                .format(chars, self.tell())
+            )
+
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Read the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+
+                # a number cut off by the end of the buffer might continue
+                # in the part of the file that's not read yet
+                if self.eof or end < len(self.buf) \
+                        and self.buf[end] not in '.eE+-0123456789':
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise CAGridInvalidError(
+                        "Invalid grid file: {} at character {}".format(
+                            e.msg, self.offset + e.pos
+                        )
+                    ) from e
+
+            self.read()
+
+
+def read_json(filename):
+    """
+    Read a JSON grid file.
+
+    Returns the configuration of the grid as a dict, and the state, altitude
+    (in meters), vegetation code and density code arrays.
+
+    Params:
+    - filename: Path to the grid file
+    """
+    conf = {}
+    arrays = None
+
+    with open(filename) as f:
+        reader = JSONReader(f)
+
+        reader.expect('{')
+        while not reader.peek() == '}':
+            key = reader.value()
+            reader.expect(':')
+
+            if key == 'grid':
+                arrays = read_json_grid(
+                    reader, os.path.getsize(filename), conf.get('max_alt')
+                )
+            else:
+                conf[key] = reader.value()
+
+            if reader.expect(',}') == '}':
+                break
+
+    for key in ('p0', 'wind_dir', 'wind_speed', 'max_alt'):
+        if key not in conf:
+            raise CAGridInvalidError(
+                "Invalid grid file: missing '{}'".format(key)
+            )
+    if arrays is None:
+        raise CAGridInvalidError("Invalid grid file: missing 'grid'")
+
+    state, alt, veg, dens, scaled = arrays
+    if not scaled:
+        alt *= conf['max_alt']
+
+    return conf, state, alt, veg, dens
+
+
+def read_json_grid(reader, size, max_alt=None):
+    """
+    Read the grid of a JSON grid file into typed arrays, row by row.
+
+    Returns the state, altitude, vegetation code and density code arrays,
+    and whether the altitudes are in meters already.
+
+    Params:
+    - reader: JSONReader positioned at the start of the grid
+    - size: Size of the grid file in bytes, to estimate the amount of rows
+    - max_alt: Maximum altitude to scale the altitudes with, if it's known
+               before the grid
+    """
+    reader.expect('[')
+    if reader.peek() == ']':
+        raise CAGridInvalidError("Invalid grid file: the grid is empty")
+
+    height = 0
+    arrays = None
+    while True:
+        start = reader.tell()
+        row = reader.value()
+        y = height + 1
+
+        if not isinstance(row, list) or not row:
+            raise CAGridInvalidError(
+                "Invalid grid file: row {} is not a list of cells".format(y)
+            )
+
+        if arrays is None:
+            # allocate room for as many rows as there are rows of this size
+            # left in the file
+            width = len(row)
+            row_size = max(reader.tell() - start, 1)
+            capacity = (size - start) // row_size + 1
+            arrays = [
+                np.empty((capacity, width), dtype=dtype)
+                for dtype in (np.uint8, np.float32, np.uint8, np.uint8)
+            ]
+        elif not len(row) == width:
+            raise CAGridInvalidError(
+                "Grid should be rectangular, row {} has {} cells instead of {}"
+                .format(y, len(row), width)
+            )
+
+        if height == len(arrays[0]):
+            arrays = [
+                np.concatenate([array, np.empty_like(array)])
+                for array in arrays
+            ]
+
+        read_json_row(
+            row, y, [array[height] for array in arrays], max_alt or 1
+        )
+        height += 1
+
+        if reader.expect(',]') == ']':
+            break
+
+    return [array[:height] for array in arrays] + [max_alt is not None]
+
+
+def read_json_row(row, y, arrays, max_alt=1):
+    """
+    Read a row of cells from a JSON grid file into typed arrays.
+
+    Params:
+    - row: The row of cells, as parsed from the JSON
+    - y: Number of the row, for error messages
+    - arrays: The state, altitude, vegetation code and density code arrays
+              of the row, to store the cells in
+    - max_alt: Maximum altitude to scale the altitudes with
+    """
+    state, alt, veg, dens = arrays
+
+    try:
+        states = [cell['sta'] for cell in row]
+        alts = [cell['alt'] for cell in row]
+        if not all(map(is_state, states)) \
+                or not all(map(is_altitude, alts)):
+            raise ValueError("Invalid state or altitude")
+
+        state[:] = states
+        alt[:] = np.array(alts, dtype=np.float64) * max_alt
+        veg[:] = [VEG_CODES[cell['veg']] for cell in row]
+        dens[:] = [DENS_CODES[cell['den']] for cell in row]
+    except (KeyError, TypeError, ValueError) as e:
+        # go through the row again, cell by cell, to report the culprit
+        for x, cell in enumerate(row, 1):
+            error = validate_json_cell(cell)
+            if error:
+                raise CAGridInvalidError(
+                    "Invalid grid file: {} at row {}, column {}".format(
+                        error, y, x
+                    )
+                ) from e
+
+        raise CAGridInvalidError(
+            "Invalid grid file: invalid cells at row {}".format(y)
+        ) from e
+
+
+def is_state(value):
+    """
+    Check whether a value from a JSON grid file is a state.
+
+    States are the integers 0, 1 and 2, not booleans or floats.
+
+    Params:
+    - value: The value, as parsed from the JSON
+    """
+    return isinstance(value, int) and not isinstance(value, bool) \
+        and 0 <= value <= 2
+
+
+def is_altitude(value):
+    """
+    Check whether a value from a JSON grid file is an altitude.
+
+    Params:
+    - value: The value, as parsed from the JSON
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_json_cell(cell):
+    """
+    Validate a cell from a JSON grid file.
+
+    Returns what is wrong with the cell, or None if it's valid.
+
+    Params:
+    - cell: The cell, as parsed from the JSON
+    """
+    if not isinstance(cell, dict):
+        return "cell is not an object"
+
+    for key in ('alt', 'veg', 'den', 'sta'):
+        if key not in cell:
+            return "cell has no '{}'".format(key)
+
+    if not is_altitude(cell['alt']):
+        return "invalid altitude {!r}".format(cell['alt'])
+    if cell['veg'] not in VEG_CODES:
+        return "invalid vegetation type {!r}".format(cell['veg'])
+    if cell['den'] not in DENS_CODES:
+        return "invalid vegetation density {!r}".format(cell['den'])
+    if not is_state(cell['sta']):
+        return "invalid state {!r}".format(cell['sta'])
+
+    return None
+
+
+def is_binary(filename):
+    """
+    Check whether a grid file is in the binary format.
+
+    Params:
+    - filename: Path to the grid file
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def layout(height, width):
+    """
+    Return the dtype and offset of each of the arrays in a binary grid file.
+
+    Params:
+    - height: Amount of rows of the grid
+    - width: Amount of columns of the grid
+    """
+    offset = HEADER.itemsize
+    arrays = {}
+    for name, dtype in (('alt', np.float32), ('veg', np.uint8),
+                        ('dens', np.uint8), ('state', np.uint8)):
+        arrays[name] = np.dtype(dtype), offset
+        offset += height * width * np.dtype(dtype).itemsize
+
+    return arrays
+
+
+def read_binary(filename, validate=True):
+    """
+    Read a binary grid file.
+
+    Returns the configuration of the grid as a dict, like in the JSON grid
+    files, and the read-only memory mapped state, altitude, vegetation code
+    and density code arrays.
+
+    Params:
+    - filename: Path to the grid file
+    - validate: Check the cells, which reads all of the arrays
+    """
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if not len(header) == 1 or not header['magic'][0] == MAGIC:
+        raise CAGridInvalidError("Invalid grid file: not a binary grid file")
+
+    header = header[0]
+    if not header['version'] == VERSION:
+        raise CAGridInvalidError(
+            "Invalid grid file: unsupported version {}".format(
+                header['version']
+            )
+        )
+
+    conf = {
+        'p0': float(header['p0']),
+        'wind_dir': header['wind_dir'].copy(),
+        'wind_speed': float(header['wind_speed']),
+        'max_alt': float(header['max_alt']),
+    }
+
+    # the state array comes last, so the file ends with it
+    shape = int(header['height']), int(header['width'])
+    dtype, offset = layout(*shape)['state']
+    if not all(shape):
+        raise CAGridInvalidError("Invalid grid file: the grid is empty")
+    if os.path.getsize(filename) < offset + shape[0] * shape[1]:
+        raise CAGridInvalidError(
+            "Invalid grid file: no room for {} by {} cells".format(*shape)
+        )
+
+    arrays = {}
+    for name, (dtype, offset) in layout(*shape).items():
+        arrays[name] = np.memmap(
+            filename, dtype=dtype, mode='r', offset=offset, shape=shape
+        )
+
+    if validate:
+        if arrays['veg'].max() >= len(Cell.vegetations):
+            raise CAGridInvalidError(
+                "Invalid grid file: invalid vegetation code"
+            )
+        if arrays['dens'].max() >= len(Cell.densities):
+            raise CAGridInvalidError(
+                "Invalid grid file: invalid density code"
+            )
+        if arrays['state'].max() > 2:
+            raise CAGridInvalidError("Invalid grid file: invalid state")
+
+    return (
+        conf, arrays['state'], arrays['alt'], arrays['veg'], arrays['dens']
+    )
+
+
+def write_binary(filename, conf, state, alt, veg, dens):
+    """
+    Write a binary grid file.
+
+    Params:
+    - filename: Path to the grid file
+    - conf: Configuration of the grid, with the p0, wind_dir, wind_speed and
+            max_alt keys like in the JSON grid files
+    - state: States of the cells
+    - alt: Altitudes of the cells in meters
+    - veg: Vegetation codes of the cells
+    - dens: Density codes of the cells
+    """
+    height, width = state.shape
+
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['height'] = height
+    header['width'] = width
+    header['p0'] = conf['p0']
+    header['wind_dir'] = conf['wind_dir']
+    header['wind_speed'] = conf['wind_speed']
+    header['max_alt'] = conf['max_alt']
+
+    arrays = {'alt': alt, 'veg': veg, 'dens': dens, 'state': state}
+    with open(filename, 'wb') as f:
+        f.write(header.tobytes())
+        for name, (dtype, offset) in layout(height, width).items():
+            np.ascontiguousarray(arrays[name], dtype=dtype).tofile(f)
+
+
+def tile_filename(directory, ty, tx):
+    """
+    Return the path of the binary grid file of a tile of a tiled grid.
+
+    Params:
+    - directory: Directory of the tiled grid
+    - ty: Row of the tile
+    - tx: Column of the tile
+    """
+    return os.path.join(directory, 'tile_{}_{}.grid'.format(ty, tx))
+
+
+def write_manifest(directory, conf, height, width, tile_size, counts,
+                   ignitions):
+    """
+    Write the manifest of a tiled grid.
+
+    A tiled grid is a directory with a binary grid file per tile, and a
+    manifest describing the grid as a whole.
+
+    Params:
+    - directory: Directory of the tiled grid
+    - conf: Configuration of the grid, like in the JSON grid files
+    - height: Amount of rows of the whole grid
+    - width: Amount of columns of the whole grid
+    - tile_size: Amount of rows and columns of a tile
+    - counts: Amount of cells per state in the whole grid
+    - ignitions: Rows and columns (ty, tx) of the tiles with burning cells
+    """
+    manifest = dict(conf)
+    manifest['wind_dir'] = list(map(float, conf['wind_dir']))
+    manifest['height'] = height
+    manifest['width'] = width
+    manifest['tile_size'] = tile_size
+    manifest['counts'] = list(counts)
+    manifest['ignitions'] = [list(tile) for tile in ignitions]
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def read_manifest(directory):
+    """
+    Read the manifest of a tiled grid.
+
+    Params:
+    - directory: Directory of the tiled grid
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        return json.load(f)
@@ -0,0 +1,151 @@
+"""Defines the instrumentation of the steps of a CA."""
+
+import numpy as np
+import time
+
+
+class Instrument:
+    """
+    Measures the steps of a CA and reports them to observers.
+
+    Set an instrument as the instrument attribute of a CA, or use CA.observe,
+    to measure its steps. Each step is split in phases, timed by marking the
+    end of each phase. After the step, the observers are called with the CA
+    and a dict of the metrics of the step:
+    - step: Number of the step, counting from 1
+    - seconds: Duration of the step
+    - phases: Duration of each phase of the step, by name
+    - cells_evaluated: Amount of cells the evolution rule evolved
+    - ignition_checks: Amount of burning neighbors of the unburnt cells,
+                       each of which may ignite the cell
+    - ignitions: Amount of cells that ignited
+    - burning: Amount of cells burning after the step
+    - burned: Amount of cells burned out after the step
+    """
+
+    def __init__(self):
+        """Construct the instrument."""
+        self.observers = []
+        self.steps = 0
+        self._phases = None
+        self._start = None
+        self._last = None
+
+    def add_observer(self, observer):
+        """
+        Add an observer of the steps.
+
+        Args:
+        - observer: Function called as observer(ca, metrics) after each step
+        """
+        self.observers.append(observer)
+
+    def start(self):
+        """Start measuring a step."""
+        self._phases = {}
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        Mark the end of a phase of the step.
+
+        The time since the previous mark, or since the start of the step,
+        is added to the phase.
+
+        Args:
+        - phase: Name of the phase
+        """
+        now = time.perf_counter()
+        self._phases[phase] = self._phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def finish(self, ca, previous, cells_evaluated, offsets):
+        """
+        Finish measuring a step and report it to the observers.
+
+        Args:
+        - ca: The CA after the step
+        - previous: State array of the CA before the step
+        - cells_evaluated: Amount of cells the evolution rule evolved
+        - offsets: Offsets (dy, dx) of the neighbors of a cell
+        """
+        seconds = time.perf_counter() - self._start
+        self.steps += 1
+
+        # count the burning neighbors of each cell, only where it matters
+        height, width = previous.shape
+        r = max(max(abs(dy), abs(dx)) for dy, dx in offsets)
+        burning = np.pad(previous == 1, r, 'constant')
+        neighbors = np.zeros(previous.shape, dtype=np.uint8)
+        for dy, dx in offsets:
+            neighbors += burning[r+dy:height+r+dy, r+dx:width+r+dx]
+        unburnt = previous == 0
+
+        metrics = {
+            'step': self.steps,
+            'seconds': seconds,
+            'phases': self._phases,
+            'cells_evaluated': int(cells_evaluated),
+            'ignition_checks': int(neighbors[unburnt].sum()),
+            'ignitions': int(np.count_nonzero(unburnt & (ca.state == 1))),
+            'burning': ca.burning_cells(),
+            'burned': ca.burned_cells(),
+        }
+
+        for observer in self.observers:
+            observer(ca, metrics)
+
+
+class StepRecorder:
+    """Observer recording the metrics of every step, as a time series."""
+
+    def __init__(self):
+        """Construct the recorder."""
+        self.metrics = []
+
+    def __call__(self, ca, metrics):
+        """
+        Record the metrics of a step.
+
+        Args:
+        - ca: The CA after the step
+        - metrics: The metrics of the step
+        """
+        self.metrics.append(metrics)
+
+    def series(self):
+        """
+        Return the recorded metrics as arrays, one element per step.
+
+        The durations of the phases are named like phase_<name>, with zeros
+        for the steps that didn't have the phase.
+        """
+        phases = []
+        for metrics in self.metrics:
+            phases.extend(
+                phase for phase in metrics['phases'] if phase not in phases
+            )
+
+        series = {}
+        for name in ('step', 'seconds', 'cells_evaluated', 'ignition_checks',
+                     'ignitions', 'burning', 'burned'):
+            series[name] = np.array([m[name] for m in self.metrics])
+        for phase in phases:
+            series['phase_' + phase] = np.array(
+                [m['phases'].get(phase, 0.0) for m in self.metrics]
+            )
+
+        return series
+
+    def save(self, filename):
+        """
+        Save the recorded metrics as CSV, with a row per step.
+
+        Args:
+        - filename: Path to the CSV file
+        """
+        series = self.series()
+        np.savetxt(
+            filename, np.column_stack(list(series.values())), delimiter=',',
+            header=','.join(series), comments='', fmt='%.9g'
+        )
@@ -0,0 +1,122 @@
+"""Defines the landscape of a CA, and views of its cells."""
+
+from .cell import CellView
+
+
+class Landscape:
+    """
+    The landscape of a CA: the attributes of the cells that don't change.
+
+    The attributes are stored as a structure of arrays, one array per
+    attribute, indexed by row and column:
+    - alt: Altitudes in meters, as float32
+    - veg: Vegetation codes, indices in Cell.vegetations, as uint8
+    - dens: Density codes, indices in Cell.densities, as uint8
+
+    Positions follow from the indices, so they aren't stored.
+    """
+
+    def __init__(self, alt, veg, dens):
+        """
+        Construct the landscape.
+
+        Args:
+        - alt: Altitudes of the cells
+        - veg: Vegetation codes of the cells
+        - dens: Density codes of the cells
+        """
+        self.alt = alt
+        self.veg = veg
+        self.dens = dens
+        self.shape = alt.shape
+
+    def nbytes(self):
+        """Return the amount of bytes the attributes take."""
+        return self.alt.nbytes + self.veg.nbytes + self.dens.nbytes
+
+
+class GridView:
+    """
+    View of the grid of a CA as cells, for evolution rules that use cells.
+
+    Indexing a row and a column gives a CellView of that cell, slicing gives
+    a GridView of part of the grid. The views read the current state of the
+    CA, so they don't hold any cells themselves.
+    """
+
+    def __init__(self, ca, y0=0, x0=0, shape=None):
+        """
+        Construct the view.
+
+        Args:
+        - ca: The CA to view
+        - y0: Row of the CA at the top of the view
+        - x0: Column of the CA at the left of the view
+        - shape: Amount of rows and columns of the view, all of the CA when
+                 None. The view may reach outside of the grid of the CA,
+                 where it holds non-flammable cells.
+        """
+        self.ca = ca
+        self.y0 = y0
+        self.x0 = x0
+        self.shape = ca.state.shape if shape is None else shape
+
+    def __len__(self):
+        """Return the amount of rows."""
+        return self.shape[0]
+
+    def __iter__(self):
+        """Iterate over the rows, as lists of cells."""
+        height, width = self.shape
+        for y in range(height):
+            yield [self[y, x] for x in range(width)]
+
+    def __getitem__(self, index):
+        """
+        Return a cell, a row of cells, or a view of part of the grid.
+
+        Args:
+        - index: Row and column of a cell, slices of rows and columns, or a
+                 row, which gives a list of the cells of the row like
+                 iterating does
+        """
+        height, width = self.shape
+        if not isinstance(index, tuple):
+            if isinstance(index, slice):
+                return self[index, :]
+            if not -height <= index < height:
+                raise IndexError("Row index out of range")
+            return [self[index, x] for x in range(width)]
+
+        y, x = index
+
+        if isinstance(y, slice) or isinstance(x, slice):
+            ys = _to_range(y, height)
+            xs = _to_range(x, width)
+            return GridView(
+                self.ca, self.y0 + ys.start, self.x0 + xs.start,
+                (len(ys), len(xs))
+            )
+
+        if not -height <= y < height or not -width <= x < width:
+            raise IndexError("Cell index out of range")
+
+        return CellView(self.ca, self.y0 + y % height, self.x0 + x % width)
+
+
+def _to_range(index, length):
+    """
+    Return the range of indices an index selects, like NumPy does.
+
+    Args:
+    - index: Slice or integer index
+    - length: Length of the indexed axis
+    """
+    if not isinstance(index, slice):
+        index = slice(index % length, index % length + 1)
+
+    indices = range(*index.indices(length))
+    if not indices.step == 1:
+        raise IndexError("Grid views can only be sliced with a step of 1")
+
+    return indices
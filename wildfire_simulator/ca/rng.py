@@ -0,0 +1,221 @@
+"""Defines counter-based random numbers for the cells of a CA."""
+
+import numpy as np
+
+
+# Arithmetic on 64 bit words, for the random numbers of single cells
+MASK = 2**64 - 1
+
+# Constants of the SplitMix64 mixing function
+GOLDEN = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+
+
+def _mix(z):
+    """
+    Mix the bits of 64 bit words, with the SplitMix64 finalizer.
+
+    Params:
+    - z: Array of uint64 words
+    """
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(MIX2)
+    return z ^ (z >> np.uint64(31))
+
+
+def _mix_int(z):
+    """
+    Mix the bits of a 64 bit word, like _mix but on a Python int.
+
+    Params:
+    - z: The word
+    """
+    z = ((z ^ (z >> 30)) * MIX1) & MASK
+    z = ((z ^ (z >> 27)) * MIX2) & MASK
+    return z ^ (z >> 31)
+
+
+class CellRandom:
+    """
+    Random numbers of a run of a CA, for every cell at every step.
+
+    The numbers are a hash of the seed, the step, the row and column of the
+    cell and the number of the draw for the cell in the step. So every cell
+    always gets the same numbers, in whatever order or grouping the cells
+    are evolved: a run gives the same burn scar when evolving the whole grid
+    or only the fire front, in tiles or in a batch with other runs.
+    """
+
+    def __init__(self, seed=None, origin=(0, 0)):
+        """
+        Construct the random numbers of a run.
+
+        Params:
+        - seed: An int, a numpy SeedSequence, or a numpy Generator to draw
+                the seed from. Fresh entropy if None.
+        - origin: Row and column (y, x) in the landscape of the first cell
+                  of the CA, for CAs that cover part of a landscape
+        """
+        if isinstance(seed, np.random.Generator):
+            seed = np.random.SeedSequence(
+                seed.integers(0, 2**63, size=4).tolist()
+            )
+        elif not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+
+        self.seed_sequence = seed
+        self.key = seed.generate_state(2, np.uint64)
+        self.origin = origin
+
+    def spawn(self, n):
+        """
+        Return the random numbers of independent child runs.
+
+        Params:
+        - n: Amount of child runs
+        """
+        return [CellRandom(child) for child in self.seed_sequence.spawn(n)]
+
+    def shifted(self, dy, dx):
+        """
+        Return the same random numbers for a CA covering another area.
+
+        Params:
+        - dy: Row in the landscape of the first cell, relative to the origin
+        - dx: Column in the landscape of the first cell, relative to the
+              origin
+        """
+        shifted = CellRandom(self.seed_sequence)
+        shifted.origin = self.origin[0] + dy, self.origin[1] + dx
+        return shifted
+
+    def for_step(self, step):
+        """
+        Return the random numbers of a step.
+
+        Params:
+        - step: Number of the step, counting from 0
+        """
+        return StepRandom([self], step)
+
+
+class StepRandom:
+    """
+    Random numbers of the cells in one step of one or more runs.
+
+    Every cell may draw several numbers in a step, numbered from 0.
+    """
+
+    def __init__(self, randoms, step):
+        """
+        Construct the random numbers of a step.
+
+        Params:
+        - randoms: CellRandoms of the runs, with the same origin
+        - step: Number of the step, counting from 0
+        """
+        self.origin = randoms[0].origin
+        self.step = step
+        self._keys = [[int(key) for key in r.key] for r in randoms]
+        self._salt_cache = {}
+
+    def _salts(self, draw):
+        """
+        Return the salt and the key of each run, for a draw of the step.
+
+        Params:
+        - draw: Number of the draw
+        """
+        if draw not in self._salt_cache:
+            counter = (self.step << 8) | draw
+            self._salt_cache[draw] = [
+                (_mix_int(key0 ^ _mix_int((counter + GOLDEN) & MASK)), key1)
+                for key0, key1 in self._keys
+            ]
+
+        return self._salt_cache[draw]
+
+    def cells(self, ys, xs, draw=0):
+        """
+        Return numbers in [0, 1) for cells of a single run.
+
+        Params:
+        - ys: Rows of the cells
+        - xs: Columns of the cells
+        - draw: Number of the draw of the cells
+        """
+        (salt, key), = self._salts(draw)
+        words = self._words(
+            np.asarray(ys, dtype=np.int64), np.asarray(xs, dtype=np.int64)
+        )
+
+        return self._uniform(words, np.uint64(salt), np.uint64(key))
+
+    def grid(self, shape, draw=0):
+        """
+        Return numbers in [0, 1) for all cells of a grid, in every run.
+
+        The result has a leading axis for the runs when there are several.
+
+        Params:
+        - shape: Rows and columns of the grid
+        - draw: Number of the draw of the cells
+        """
+        height, width = shape
+        words = self._words(
+            np.arange(height, dtype=np.int64)[:, np.newaxis],
+            np.arange(width, dtype=np.int64)
+        )
+
+        salts = np.array(self._salts(draw), dtype=np.uint64)
+        if len(salts) == 1:
+            return self._uniform(words, salts[0, 0], salts[0, 1])
+
+        return self._uniform(
+            words, salts[:, 0, np.newaxis, np.newaxis],
+            salts[:, 1, np.newaxis, np.newaxis]
+        )
+
+    def cell(self, y, x, draw=0):
+        """
+        Return a number in [0, 1) for a cell of a single run.
+
+        This gives the same number as cells, without the overhead of arrays.
+
+        Params:
+        - y: Row of the cell
+        - x: Column of the cell
+        - draw: Number of the draw of the cell
+        """
+        (salt, key), = self._salts(draw)
+        word = (
+            ((y + self.origin[0]) << 32) | ((x + self.origin[1]) & 0xFFFFFFFF)
+        ) & MASK
+        h = _mix_int((_mix_int(word ^ salt) + key) & MASK)
+
+        return (h >> 11) * 2.0**-53
+
+    def _words(self, ys, xs):
+        """
+        Return the rows and columns of cells in the landscape as words.
+
+        Params:
+        - ys: Rows of the cells in the CA, as int64
+        - xs: Columns of the cells in the CA, as int64
+        """
+        ys = ys + self.origin[0]
+        xs = (xs + self.origin[1]) & 0xFFFFFFFF
+        return ((ys << 32) | xs).astype(np.uint64)
+
+    def _uniform(self, words, salt, key):
+        """
+        Hash words of cells into numbers in [0, 1).
+
+        Params:
+        - words: The rows and columns of the cells as uint64 words
+        - salt: Salt of the step, draw and run
+        - key: Key of the run
+        """
+        h = _mix(_mix(words ^ salt) + key)
+        return (h >> np.uint64(11)) * 2.0**-53
@@ -0,0 +1,134 @@
+"""Defines the spotting of a fire, by embers flying in the wind."""
+
+import numpy as np
+from .stencil import MOORE
+
+
+# Number of the first random draw of a cell in a step for spotting, after
+# the draws of the evolution rules, one per neighbor of the stencil
+FIRST_DRAW = 32
+
+# Number of random draws per ember
+DRAWS = 4
+
+
+class EmberSpotting:
+    """
+    Embers carried by the wind from burning cells to cells further away.
+
+    Every step each burning cell launches each of its embers with some
+    probability. An ember flies in the direction of the wind at the cell,
+    deviating by a uniformly distributed angle, over an exponentially
+    distributed distance of which the mean grows with the wind speed. It
+    ignites the cell it lands on with the probability that the fuel of the
+    cell burns, the base probability of NNEvolutionRule with the vegetation
+    and density factors. So the evolution rule needs to give the wind and
+    the fuel at cells, with wind_at and fuel_at like NNEvolutionRule.
+
+    The embers are sampled for all burning cells at once, so the cost is
+    proportional to the amount of burning cells, however far they fly.
+    """
+
+    def __init__(self, p_launch=0.02, embers=1, distance=2.0,
+                 distance_per_speed=0.5, min_distance=2.0, spread=0.5):
+        """
+        Construct the spotting.
+
+        Params:
+        - p_launch: Probability that a burning cell launches an ember
+        - embers: Amount of embers each burning cell may launch per step
+        - distance: Mean distance in cells an ember flies without wind,
+                    beyond the min_distance
+        - distance_per_speed: Mean distance in cells an ember flies further
+                              per meter per second of wind
+        - min_distance: Distance in cells an ember flies at least, to land
+                        beyond the neighbors of the burning cell
+        - spread: Largest angle in radians between the wind and the
+                  direction of an ember
+        """
+        if FIRST_DRAW + DRAWS * embers > 256:
+            raise ValueError("Too many embers per cell")
+
+        self.p_launch = p_launch
+        self.embers = embers
+        self.distance = distance
+        self.distance_per_speed = distance_per_speed
+        self.min_distance = min_distance
+        self.spread = spread
+
+    def check(self, rule):
+        """
+        Check that an evolution rule gives the wind and the fuel at cells.
+
+        Params:
+        - rule: The evolution rule of the CA
+        """
+        if not all(hasattr(rule, name) for name in ('wind_at', 'fuel_at')):
+            raise ValueError(
+                "Spotting needs the wind and the fuel of the evolution rule"
+            )
+
+    def landings(self, ca, rng=None):
+        """
+        Return the cells where the embers launched in a step ignite.
+
+        Returns the rows and columns (ys, xs) of the cells, which may
+        include cells that already burn.
+
+        Params:
+        - ca: The CA, with an evolution rule like NNEvolutionRule
+        - rng: StepRandom of the step, or None to use numpy.random
+        """
+        height, width = ca.state.shape
+        rule = ca.evolution_rule
+        stencil = getattr(rule, 'stencil', MOORE)
+        ys, xs = ca.burning_positions()
+
+        wind = rule.wind_at(ys, xs)
+        speed = np.hypot(wind[:, 0], wind[:, 1])
+        angle = np.arctan2(wind[:, 1], wind[:, 0])
+        mean = self.distance + self.distance_per_speed * speed
+
+        landings_y, landings_x = [], []
+        for ember in range(self.embers):
+            draws = self._draws(rng, ys, xs, ember)
+
+            # the distance follows from the inverse of the distribution
+            launched = draws[0] < self.p_launch
+            distance = self.min_distance - mean * np.log1p(-draws[1])
+            direction = angle + self.spread * (2 * draws[2] - 1)
+
+            # the wind vectors are (x, y) in space, which the stencil maps
+            # to the rows and columns of the grid
+            dy, dx = stencil.grid_offsets(
+                distance * np.cos(direction), distance * np.sin(direction)
+            )
+            ly = ys + np.rint(dy).astype(np.intp)
+            lx = xs + np.rint(dx).astype(np.intp)
+            landed = launched & (ly >= 0) & (ly < height) & \
+                (lx >= 0) & (lx < width)
+            ly, lx, ignite = ly[landed], lx[landed], draws[3][landed]
+
+            ignites = ignite < np.clip(rule.fuel_at(ly, lx), 0, 1)
+            landings_y.append(ly[ignites])
+            landings_x.append(lx[ignites])
+
+        return np.concatenate(landings_y), np.concatenate(landings_x)
+
+    def _draws(self, rng, ys, xs, ember):
+        """
+        Return the random numbers of an ember of burning cells.
+
+        Params:
+        - rng: StepRandom of the step, or None to use numpy.random
+        - ys: Rows of the burning cells
+        - xs: Columns of the burning cells
+        - ember: Number of the ember of each cell
+        """
+        if rng is None:
+            return np.random.random((DRAWS, len(ys)))
+
+        first = FIRST_DRAW + DRAWS * ember
+        return [
+            rng.cells(ys, xs, draw) for draw in range(first, first + DRAWS)
+        ]
@@ -0,0 +1,137 @@
+"""Defines the neighborhoods of the cells that evolution rules use."""
+
+import numpy as np
+
+
+# Square of the distance in cells up to which neighbors ignite a cell at full
+# strength with a fall-off: the reach of the 3x3 neighborhood, for which the
+# factors of the ignition probability were fitted
+FULL_REACH_SQUARED = 2
+
+# Sum of the weights of the neighbors of a stencil with a fall-off, the
+# amount of neighbors of the 3x3 neighborhood
+TOTAL_WEIGHT = 8
+
+
+class Stencil:
+    """
+    The neighbors of a cell, as offsets in the grid and vectors in space.
+
+    The offsets (dy, dx) give the rows and columns of the neighbors relative
+    to a cell, in the order in which they are checked. The vectors (x, y)
+    give the positions of their centers relative to the cell, in cells,
+    which is where the geometry of the grid comes in: for a square grid they
+    are the offsets themselves. The distances and the burn directions, from
+    each neighbor to the cell, follow from them once, so the evolution rules
+    only look them up.
+
+    The neighbors ignite a cell with a weight on the probability, see
+    weights. It is 1 for all neighbors, so far neighbors ignite a cell as
+    easily as adjacent ones, and a larger stencil also spreads the fire
+    further per step. With a fall-off, the weight of the neighbors beyond
+    the reach of the 3x3 neighborhood falls off with the square of the
+    distance, like the heat a fire radiates, and the weights of all
+    neighbors add up to the 8 of the 3x3 neighborhood. A burning cell then
+    exerts the same ignition pressure with every stencil, which only
+    changes how it is spread over the directions and distances.
+    """
+
+    def __init__(self, name, offsets, vectors=None, falloff=False):
+        """
+        Construct the stencil.
+
+        Params:
+        - name: Name of the stencil, see STENCILS
+        - offsets: Offsets (dy, dx) of the neighbors, of which the opposite
+                   offsets are neighbors too
+        - vectors: Positions (x, y) of the neighbors relative to the cell,
+                   (dx, dy) of the offsets if None
+        - falloff: Weigh the neighbors beyond the 3x3 neighborhood down by
+                   their distance
+        """
+        if any((-dy, -dx) not in offsets for dy, dx in offsets):
+            raise ValueError("Stencils need the opposite of every offset")
+
+        self.name = name
+        self.offsets = [(int(dy), int(dx)) for dy, dx in offsets]
+        if vectors is None:
+            vectors = [(dx, dy) for dy, dx in self.offsets]
+        self.vectors = np.array(vectors, dtype=np.float64)
+
+        # the largest offset, which is how far the grid has to be padded
+        self.radius = max(max(abs(dy), abs(dx)) for dy, dx in self.offsets)
+        self.distances = np.hypot(self.vectors[:, 0], self.vectors[:, 1])
+
+        # factor of the ignition probability of each neighbor
+        self.falloff = falloff
+        self.weights = np.ones(len(self.offsets))
+        if falloff:
+            self.weights = np.minimum(
+                1, FULL_REACH_SQUARED / (self.vectors ** 2).sum(axis=1)
+            )
+            self.weights *= TOTAL_WEIGHT / self.weights.sum()
+
+        # unit vectors from each neighbor to the cell
+        self.burn_directions = -self.vectors / self.distances[:, np.newaxis]
+
+        # the linear map from vectors to offsets, the geometry of the grid
+        self._to_offsets = np.linalg.lstsq(
+            self.vectors, np.array(self.offsets, dtype=np.float64),
+            rcond=None
+        )[0]
+
+    def grid_offsets(self, x, y):
+        """
+        Return the offsets (dy, dx) in the grid of vectors in space.
+
+        The offsets are not rounded, so they fall between cells.
+
+        Params:
+        - x: Components along x of the vectors, in cells
+        - y: Components along y of the vectors, in cells
+        """
+        offsets = np.stack([x, y], axis=-1) @ self._to_offsets
+        return offsets[..., 0], offsets[..., 1]
+
+    def __len__(self):
+        """Return the amount of neighbors."""
+        return len(self.offsets)
+
+    def __repr__(self):
+        """Return the name of the stencil."""
+        return 'Stencil({!r})'.format(self.name)
+
+
+# The 3x3 neighborhood of a square grid
+MOORE = Stencil('moore', [
+    (dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx
+])
+
+# The 5x5 neighborhood of a square grid
+MOORE_2 = Stencil('moore2', [
+    (dy, dx) for dy in range(-2, 3) for dx in range(-2, 3) if dy or dx
+])
+
+# The 3x3 neighborhood and the knight moves, 16 directions in all
+KNIGHT = Stencil('knight', MOORE.offsets + [
+    (dy, dx) for dy in (-2, -1, 1, 2) for dx in (-2, -1, 1, 2)
+    if abs(dy) != abs(dx)
+])
+
+# The same neighborhoods, of which the far neighbors are weighed down
+MOORE_2_FALLOFF = Stencil('moore2-falloff', MOORE_2.offsets, falloff=True)
+KNIGHT_FALLOFF = Stencil('knight-falloff', KNIGHT.offsets, falloff=True)
+
+# The 6 neighbors of a hexagonal grid in axial coordinates, where every row
+# is shifted half a cell to the right of the row above it
+_HEXAGONAL_OFFSETS = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0)]
+HEXAGONAL = Stencil('hex', _HEXAGONAL_OFFSETS, [
+    (dx + dy / 2, dy * np.sqrt(3) / 2) for dy, dx in _HEXAGONAL_OFFSETS
+])
+
+# The stencils by name
+STENCILS = {
+    stencil.name: stencil for stencil in (
+        MOORE, MOORE_2, KNIGHT, HEXAGONAL, MOORE_2_FALLOFF, KNIGHT_FALLOFF
+    )
+}
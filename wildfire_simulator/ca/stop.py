@@ -0,0 +1,175 @@
+"""Defines the criteria to stop a run of a CA."""
+
+import numpy as np
+import time
+
+
+class StopCriteria:
+    """
+    Criteria to stop a run, when the fire is out or earlier.
+
+    A run stops as soon as one of the criteria is met, checked after every
+    step. The reason is named after the criterion:
+    - out: No cells are burning anymore
+    - steps: The CA took the maximum amount of steps
+    - burned: The maximum amount of cells burned out
+    - mask: The fire reached one of the cells of the mask
+    - boundary: The fire reached the edge of the grid
+    - seconds: The run took the maximum amount of wall-clock time
+
+    The counts of the CA are kept as it steps, so checking whether the fire
+    is out or how much burned doesn't look at the grid. The mask and the
+    boundary only look at their own cells.
+    """
+
+    def __init__(self, max_steps=None, seconds=None, max_burned=None,
+                 mask=None, boundary=False):
+        """
+        Construct the criteria.
+
+        Params:
+        - max_steps: Amount of steps after which to stop, counting the steps
+                     before a run was resumed
+        - seconds: Amount of seconds after which to stop, from start
+        - max_burned: Amount of burned out cells at which to stop
+        - mask: Boolean array over the grid, of the cells where the fire
+                stops the run once it burns in any of them
+        - boundary: Stop once the fire burns at the edge of the grid
+        """
+        self.max_steps = max_steps
+        self.seconds = seconds
+        self.max_burned = max_burned
+        self.mask = mask
+        self.boundary = boundary
+
+        # rows and columns of the cells of the mask and the boundary, by
+        # the shape of the grid
+        self._cells = {}
+        self._start = None
+
+    def start(self):
+        """Start the clock of a run."""
+        self._start = time.monotonic()
+
+    def reason(self, ca):
+        """
+        Return why a run of a CA stops after its current step, or None.
+
+        Params:
+        - ca: The CA, or TiledCA
+        """
+        if ca.burning_cells() == 0:
+            return 'out'
+        if self.max_steps is not None and ca.steps >= self.max_steps:
+            return 'steps'
+        if self.max_burned is not None and \
+                ca.burned_cells() >= self.max_burned:
+            return 'burned'
+
+        for name in ('mask', 'boundary'):
+            if self._reached(ca, name):
+                return name
+
+        if self._timed_out():
+            return 'seconds'
+        return None
+
+    def reasons(self, state, burning, burned, steps):
+        """
+        Return why the runs of a stack stop after their current step.
+
+        Returns an array with the reason per run, None for the runs that
+        continue. The reasons take precedence like in reason.
+
+        Params:
+        - state: States of the runs, as a (runs, height, width) array
+        - burning: Amount of burning cells per run
+        - burned: Amount of burned out cells per run
+        - steps: Amount of steps the runs took
+        """
+        reasons = np.full(len(state), None, dtype=object)
+        if self._timed_out():
+            reasons[:] = 'seconds'
+        for name in ('boundary', 'mask'):
+            if self._enabled(name):
+                ys, xs = self._cells_of(name, state.shape[-2:])
+                reasons[(state[:, ys, xs] == 1).any(axis=1)] = name
+        if self.max_burned is not None:
+            reasons[np.asarray(burned) >= self.max_burned] = 'burned'
+        if self.max_steps is not None and steps >= self.max_steps:
+            reasons[:] = 'steps'
+        reasons[np.asarray(burning) == 0] = 'out'
+
+        return reasons
+
+    def _enabled(self, name):
+        """
+        Return whether a criterion of the cells the fire reaches is used.
+
+        Params:
+        - name: 'mask' or 'boundary'
+        """
+        if name == 'mask':
+            return self.mask is not None
+        return self.boundary
+
+    def _reached(self, ca, name):
+        """
+        Return whether the fire of a CA burns in the cells of a criterion.
+
+        Params:
+        - ca: The CA, or TiledCA
+        - name: 'mask' or 'boundary'
+        """
+        if not self._enabled(name):
+            return False
+
+        # tiled CAs only have the positions of the burning cells at hand
+        if not hasattr(ca, 'state'):
+            ys, xs = ca.burning_positions()
+            if name == 'mask':
+                return bool(self._mask(ca.shape)[ys, xs].any())
+
+            height, width = ca.shape
+            return bool((
+                (ys == 0) | (ys == height - 1) | (xs == 0) | (xs == width - 1)
+            ).any())
+
+        ys, xs = self._cells_of(name, ca.shape)
+        return bool((ca.state[ys, xs] == 1).any())
+
+    def _cells_of(self, name, shape):
+        """
+        Return the rows and columns of the cells of a criterion.
+
+        Params:
+        - name: 'mask' or 'boundary'
+        - shape: Amount of rows and columns of the grid
+        """
+        key = name, tuple(shape)
+        if key not in self._cells:
+            if name == 'mask':
+                mask = self._mask(shape)
+            else:
+                mask = np.ones(shape, dtype=bool)
+                mask[1:-1, 1:-1] = False
+            self._cells[key] = np.nonzero(mask)
+
+        return self._cells[key]
+
+    def _mask(self, shape):
+        """
+        Return the mask as a boolean array, checking that it fits the grid.
+
+        Params:
+        - shape: Amount of rows and columns of the grid
+        """
+        mask = np.asarray(self.mask, dtype=bool)
+        if not mask.shape == tuple(shape):
+            raise ValueError("The mask should match the grid")
+        return mask
+
+    def _timed_out(self):
+        """Return whether the run took the maximum amount of time."""
+        return self.seconds is not None and self._start is not None and \
+            time.monotonic() - self._start >= self.seconds
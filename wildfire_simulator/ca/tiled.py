@@ -0,0 +1,301 @@
+"""Defines a CA over a landscape stored as tiles, within the simulation."""
+
+import numpy as np
+from . import gridfile
+from .ca import CA
+from .cell import Cell
+from .evolution_rules import VectorizedNNEvolutionRule
+from .rng import CellRandom
+
+
+class TiledCA:
+    """
+    CA over a tiled landscape, loading only the tiles near the fire.
+
+    A tiled landscape is a directory with a binary grid file per tile, see
+    gridfile.write_manifest. Every tile that the fire is in or next to is
+    evolved as a CA of its own, over the tile with a border of one cell from
+    the neighboring tiles. The borders are updated from the neighbors before
+    every step, so the tiles evolve exactly like one big grid would.
+
+    Tiles the fire hasn't come near stay on disk. Of the tiles where the fire
+    has been, only the states are kept in memory.
+    """
+
+    def __init__(self, directory, evolution_rule=VectorizedNNEvolutionRule,
+                 seed=None):
+        """
+        Construct a tiled CA.
+
+        Args:
+        - directory: Directory of the tiled grid
+        - evolution_rule: Class to use as the evolution rule, vectorized
+        - seed: Seed of the random numbers, see CA.seed. A seeded tiled CA
+                burns the same as one big CA with the same seed.
+        """
+        if not getattr(evolution_rule, 'vectorized', False):
+            raise ValueError("Tiled CAs need a vectorized evolution rule")
+
+        self.directory = directory
+        self.evolution_rule = evolution_rule
+        self.conf = gridfile.read_manifest(directory)
+        self.max_alt = self.conf['max_alt']
+
+        height, width = self.conf['height'], self.conf['width']
+        self.shape = height, width
+        self.tile_size = size = self.conf['tile_size']
+        self.tiles = (height + size - 1) // size, (width + size - 1) // size
+
+        # running counts of the cells per state, and of the burned out cells
+        # per vegetation type
+        self.counts = np.array(self.conf['counts'], dtype=np.int64)
+        self.burned_veg = np.zeros(len(Cell.vegetations), dtype=np.int64)
+
+        # memory mapped grid files of the tiles, opened when needed
+        self._files = {}
+
+        # states of the tiles that the fire has come near
+        self._states = {}
+
+        # CAs of the tiles that the fire is in or next to
+        self._cas = {}
+
+        # the amount of steps taken, and the random numbers of the run
+        self.steps = 0
+        self.random = None
+        if seed is not None:
+            self.seed(seed)
+
+        for tile in self.conf['ignitions']:
+            self.load(tuple(tile))
+
+    def seed(self, seed):
+        """
+        Seed the random numbers of the run, see CA.seed.
+
+        Args:
+        - seed: An int, numpy SeedSequence or Generator, or a CellRandom
+        """
+        if not isinstance(seed, CellRandom):
+            seed = CellRandom(seed)
+        self.random = seed
+
+        for tile, ca in self._cas.items():
+            y0, _, x0, _ = self._window(tile, 1)
+            ca.seed(seed.shifted(y0, x0))
+
+    def loaded_tiles(self):
+        """Return the tiles that are loaded, as (row, column) pairs."""
+        return sorted(self._cas)
+
+    def load(self, tile):
+        """
+        Load a tile to evolve it.
+
+        Args:
+        - tile: Row and column (ty, tx) of the tile
+        """
+        if tile not in self._states:
+            self._states[tile] = np.array(self._file(tile, True)[1])
+
+        # the tile with the border of one cell around it
+        window = self._window(tile, 1)
+        arrays = [
+            self._read(name, *window)
+            for name in ('state', 'alt', 'veg', 'dens')
+        ]
+
+        rule = self.evolution_rule(
+            p0=self.conf['p0'], wind_dir=self.conf['wind_dir'],
+            wind_speed=self.conf['wind_speed']
+        )
+        ca = CA(None, rule, self.max_alt, arrays=arrays)
+
+        # the tile draws the numbers of its cells in the whole grid
+        ca.steps = self.steps
+        if self.random is not None:
+            ca.seed(self.random.shifted(window[0], window[2]))
+
+        self._cas[tile] = ca
+
+    def step(self):
+        """Evolve the CA to the next step."""
+
+        # all tiles evolve from the current step, so first update all the
+        # borders before any of the tiles evolves
+        for tile, ca in self._cas.items():
+            y0, y1, x0, x1 = self._window(tile, 1)
+            ca.state[:1] = self._read('state', y0, y0 + 1, x0, x1)
+            ca.state[-1:] = self._read('state', y1 - 1, y1, x0, x1)
+            ca.state[1:-1, :1] = self._read(
+                'state', y0 + 1, y1 - 1, x0, x0 + 1
+            )
+            ca.state[1:-1, -1:] = self._read(
+                'state', y0 + 1, y1 - 1, x1 - 1, x1
+            )
+
+        for tile, ca in self._cas.items():
+            ca.step()
+
+            # count the cells of the tile that changed state
+            state = self._states[tile]
+            new_state = ca.state[1:-1, 1:-1]
+            changed = state != new_state
+            self._count(
+                state[changed], new_state[changed],
+                ca.veg[1:-1, 1:-1][changed]
+            )
+            state[...] = new_state
+
+        self.steps += 1
+
+        # load the tiles the fire may spread to, unload those where it can't
+        needed = set()
+        edges = {-1: slice(0, 1), 0: slice(None), 1: slice(-1, None)}
+        for tile in self._cas:
+            burning = self._states[tile] == 1
+            if not burning.any():
+                continue
+
+            needed.add(tile)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    neighbor = tile[0] + dy, tile[1] + dx
+                    if not 0 <= neighbor[0] < self.tiles[0] \
+                            or not 0 <= neighbor[1] < self.tiles[1]:
+                        continue
+
+                    if burning[edges[dy], edges[dx]].any():
+                        needed.add(neighbor)
+
+        for tile in needed - set(self._cas):
+            self.load(tile)
+        for tile in set(self._cas) - needed:
+            del self._cas[tile]
+
+    def _count(self, old_states, new_states, vegs):
+        """
+        Update the running counts with the cells that changed state.
+
+        Args:
+        - old_states: Previous states of the cells
+        - new_states: New states of the cells
+        - vegs: Vegetation codes of the cells
+        """
+        self.counts -= np.bincount(old_states, minlength=3)[:3]
+        self.counts += np.bincount(new_states, minlength=3)[:3]
+
+        burned_out = (new_states == 2) & (old_states != 2)
+        self.burned_veg += np.bincount(
+            vegs[burned_out], minlength=len(Cell.vegetations)
+        )
+
+    def unburnt_cells(self):
+        """Return the amount of cells that have not burned."""
+        return int(self.counts[0])
+
+    def burning_cells(self):
+        """Return the amount of cells that are burning."""
+        return int(self.counts[1])
+
+    def burned_cells(self):
+        """Return the amount of cells that have burned out."""
+        return int(self.counts[2])
+
+    def burning_positions(self):
+        """Return the rows and columns (ys, xs) of the burning cells."""
+        positions = [(np.empty(0, dtype=np.intp),) * 2]
+        for tile in self._cas:
+            y0, _, x0, _ = self._window(tile)
+            ys, xs = np.nonzero(self._states[tile] == 1)
+            positions.append((ys + y0, xs + x0))
+
+        return tuple(np.concatenate(axis) for axis in zip(*positions))
+
+    def burned_by_vegetation(self):
+        """Return the amount of burned out cells per vegetation type."""
+        return dict(zip(Cell.vegetations, self.burned_veg.tolist()))
+
+    def get_states(self, y0=0, y1=None, x0=0, x1=None):
+        """
+        Return the states of a part of the grid.
+
+        Args:
+        - y0: First row
+        - y1: Row after the last row, the end of the grid if None
+        - x0: First column
+        - x1: Column after the last column, the end of the grid if None
+        """
+        height, width = self.shape
+        return self._read(
+            'state', y0, height if y1 is None else y1,
+            x0, width if x1 is None else x1
+        )
+
+    def _window(self, tile, border=0):
+        """
+        Return the rows and columns (y0, y1, x0, x1) covered by a tile.
+
+        Args:
+        - tile: Row and column (ty, tx) of the tile
+        - border: Amount of cells around the tile to include
+        """
+        height, width = self.shape
+        y0, x0 = tile[0] * self.tile_size, tile[1] * self.tile_size
+        y1 = min(y0 + self.tile_size, height)
+        x1 = min(x0 + self.tile_size, width)
+
+        return y0 - border, y1 + border, x0 - border, x1 + border
+
+    def _file(self, tile, validate=False):
+        """
+        Return the memory mapped grid file of a tile.
+
+        Args:
+        - tile: Row and column (ty, tx) of the tile
+        - validate: Check the cells of the tile
+        """
+        if tile not in self._files or validate:
+            self._files[tile] = gridfile.read_binary(
+                gridfile.tile_filename(self.directory, *tile), validate
+            )
+
+        return self._files[tile]
+
+    def _read(self, name, y0, y1, x0, x1):
+        """
+        Read an array of cell attributes from the tiles.
+
+        Only the needed parts of the tiles are read. Cells outside of the
+        grid have no vegetation and never burn.
+
+        Args:
+        - name: The attribute, one of state, alt, veg or dens
+        - y0: First row
+        - y1: Row after the last row
+        - x0: First column
+        - x1: Column after the last column
+        """
+        height, width = self.shape
+        size = self.tile_size
+        index = ('state', 'alt', 'veg', 'dens').index(name) + 1
+        dtype = np.float32 if name == 'alt' else np.uint8
+
+        array = np.zeros((y1 - y0, x1 - x0), dtype=dtype)
+        tys = range(max(y0, 0) // size, (min(y1, height) - 1) // size + 1)
+        txs = range(max(x0, 0) // size, (min(x1, width) - 1) // size + 1)
+        for ty in tys:
+            for tx in txs:
+                tile = ty, tx
+                if name == 'state' and tile in self._states:
+                    source = self._states[tile]
+                else:
+                    source = self._file(tile)[index]
+
+                ty0, ty1, tx0, tx1 = self._window(tile)
+                ya, yb = max(y0, ty0), min(y1, ty1)
+                xa, xb = max(x0, tx0), min(x1, tx1)
+                array[ya-y0:yb-y0, xa-x0:xb-x0] = \
+                    source[ya-ty0:yb-ty0, xa-tx0:xb-tx0]
+
+        return array
@@ -0,0 +1,66 @@
+"""Defines wind fields, wind that varies over a landscape and over time."""
+
+import numpy as np
+
+
+class WindField:
+    """
+    Wind per cell of a landscape, changing at given steps.
+
+    The wind of a cell is a vector (x, y), in the same directions as the
+    wind_dir of an evolution rule, of which the length is the wind speed in
+    meters per second.
+    """
+
+    def __init__(self, fields, steps=None):
+        """
+        Construct the wind field.
+
+        Params:
+        - fields: The wind of every cell, as an array of (height, width, 2),
+                  or a series of them as an array of (n, height, width, 2)
+        - steps: The step from which each wind of the series blows, in
+                 increasing order. The first one blows from the start, and
+                 with steps None the wind changes every step.
+        """
+        # contiguous, as the rules compare the vectors as 64 bit words
+        fields = np.ascontiguousarray(fields, dtype=np.float32)
+        if fields.ndim == 3:
+            fields = fields[np.newaxis]
+        if not fields.ndim == 4 or not fields.shape[-1] == 2:
+            raise ValueError(
+                "Wind fields should be (height, width, 2) arrays of vectors"
+            )
+
+        if steps is None:
+            steps = np.arange(len(fields))
+        steps = np.asarray(steps, dtype=np.int64)
+        if not steps.shape == (len(fields),) or (np.diff(steps) <= 0).any():
+            raise ValueError("Wind fields need increasing steps, one each")
+
+        self.fields = fields
+        self.steps = steps
+        self.shape = fields.shape[1:3]
+
+    def index(self, step):
+        """
+        Return the index of the wind that blows at a step.
+
+        Params:
+        - step: Number of the step
+        """
+        return max(int(np.searchsorted(self.steps, step, 'right')) - 1, 0)
+
+    @staticmethod
+    def load(filename):
+        """
+        Load a wind field from a NumPy .npz file.
+
+        The file holds the fields as 'fields', and optionally the steps at
+        which they start to blow as 'steps'.
+
+        Params:
+        - filename: Path to the file
+        """
+        with np.load(filename) as f:
+            return WindField(f['fields'], f['steps'] if 'steps' in f else None)
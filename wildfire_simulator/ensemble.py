@@ -0,0 +1,511 @@
+"""Contains the ensemble class, running many realizations of a wildfire."""
+
+from ca import CA, BatchCA, Cell, StopCriteria, VectorizedNNEvolutionRule
+from multiprocessing import Pool
+import numpy as np
+import os
+import random
+
+
+# The CA that the runs of a worker process start from, and the criteria to
+# stop them. They're handed to the workers once when the pool starts, so the
+# landscape is loaded only once.
+_template = None
+_stop = None
+
+# The evolution rule of the last wind a worker ran scenarios with, as
+# (wind_dir, wind_speed, rule)
+_wind_rule = None
+
+
+def _init_worker(ca, stop=None):
+    """
+    Initialize a worker process of the ensemble.
+
+    Params:
+    - ca: The CA in its initial state
+    - stop: StopCriteria of the runs, until the fire is out if None
+    """
+    global _template, _stop
+    _template = ca
+    _stop = StopCriteria() if stop is None else stop
+
+
+def _run_until_stopped(ca):
+    """
+    Evolve a CA until it meets the stop criteria.
+
+    Returns why it stopped.
+
+    Params:
+    - ca: The CA
+    """
+    _stop.start()
+    reason = _stop.reason(ca)
+    while reason is None:
+        ca.step()
+        reason = _stop.reason(ca)
+
+    return reason
+
+
+def _run_chunk(seeds):
+    """
+    Run a chunk of realizations in a worker process.
+
+    Returns how often each cell burned, and the final scar size, amount of
+    steps and stop reason of each run. A run that stops frees the worker for
+    the next one at once.
+
+    Params:
+    - seeds: Seed sequences of the random numbers, one per run
+    """
+    burned = np.zeros(_template.state.shape, dtype=np.uint32)
+    scar_sizes, durations, reasons = [], [], []
+
+    for seed in seeds:
+        ca = _template.copy()
+        ca.seed(seed)
+
+        # rules that only evolve cells draw from the random module
+        random.seed(int(seed.generate_state(1)[0]))
+
+        reasons.append(_run_until_stopped(ca))
+        burned += ca.state == 2
+        scar_sizes.append(ca.burned_cells())
+        durations.append(ca.steps - _template.steps)
+
+    return burned, scar_sizes, durations, reasons
+
+
+def _run_batch(seeds):
+    """
+    Run a chunk of realizations as one batch in a worker process.
+
+    Returns the same as _run_chunk, as every run draws the same random numbers
+    in a batch as on its own.
+
+    Params:
+    - seeds: Seed sequences of the random numbers, one per run
+    """
+    batch = BatchCA(_template, len(seeds), seeds)
+    scars = batch.scar_sizes(_stop)
+
+    # a scar series starts with the initial state, before the first step
+    burned = np.count_nonzero(batch.state == 2, axis=0).astype(np.uint32)
+    scar_sizes = [int(scar[-1]) for scar in scars]
+    durations = [len(scar) - 1 for scar in scars]
+
+    return burned, scar_sizes, durations, batch.reasons
+
+
+def _run_scenarios(tasks):
+    """
+    Run a chunk of scenarios in a worker process.
+
+    Returns a row of the results per run, see ScenarioResult.add.
+
+    Params:
+    - tasks: (index, scenario, seeds) of each scenario, with one seed
+             sequence per run
+    """
+    global _wind_rule
+
+    rows = []
+    for index, scenario, seeds in tasks:
+        # the landscape factors are shared by all scenarios, only those of
+        # the wind are computed for each wind
+        rule = _template.evolution_rule
+        if scenario.wind_dir is not None or scenario.wind_speed is not None:
+            wind = scenario.wind_dir, scenario.wind_speed
+            if _wind_rule is None or not _same_wind(_wind_rule[:2], wind):
+                _wind_rule = wind + (rule.with_wind(*wind),)
+            rule = _wind_rule[2]
+
+        for run, seed in enumerate(seeds):
+            ca = _template.copy()
+            ca.evolution_rule = rule
+            ca.set_ignitions(scenario.ignitions)
+            ca.seed(seed)
+            random.seed(int(seed.generate_state(1)[0]))
+            reason = _run_until_stopped(ca)
+
+            rows.append(
+                [index, run, ca.steps, ca.burned_cells(), reason]
+                + ca.burned_veg.tolist()
+            )
+
+    return rows
+
+
+def _same_wind(wind, other):
+    """
+    Return whether two winds (wind_dir, wind_speed) are the same.
+
+    Params:
+    - wind: The one wind
+    - other: The other wind
+    """
+    return np.array_equal(wind[0], other[0]) and wind[1] == other[1]
+
+
+class Scenario:
+    """A scenario of a wildfire: where it ignites, and the wind."""
+
+    def __init__(self, ignitions, wind_dir=None, wind_speed=None, runs=1):
+        """
+        Construct the scenario.
+
+        Params:
+        - ignitions: Rows and columns (y, x) of the cells that ignite,
+                     instead of the ones in the grid file
+        - wind_dir: Direction of the wind as a vector (x, y), the one of
+                    the grid file if None
+        - wind_speed: The wind speed in meters per second, the one of the
+                      grid file if None
+        - runs: Amount of realizations of the scenario
+        """
+        if runs < 1:
+            raise ValueError("Scenarios need at least one run")
+
+        self.ignitions = [tuple(ignition) for ignition in ignitions]
+        self.wind_dir = None if wind_dir is None else tuple(wind_dir)
+        self.wind_speed = wind_speed
+        self.runs = runs
+
+    @staticmethod
+    def from_dict(scenario):
+        """
+        Create a scenario from a dict, like one read from JSON.
+
+        Params:
+        - scenario: Dict with the ignitions, and optionally the wind_dir,
+                    wind_speed and runs
+        """
+        return Scenario(
+            scenario['ignitions'], scenario.get('wind_dir'),
+            scenario.get('wind_speed'), scenario.get('runs', 1)
+        )
+
+    @staticmethod
+    def lattice(ca, spacing, runs=1):
+        """
+        Create a scenario per ignition point on a lattice over a landscape.
+
+        Only the cells that can burn are ignition points, so the scenarios
+        map the risk of fires starting anywhere in the landscape.
+
+        Params:
+        - ca: The CA of the landscape
+        - spacing: Amount of cells between the ignition points
+        - runs: Amount of realizations of each scenario
+        """
+        if spacing < 1:
+            raise ValueError("The spacing should be at least one cell")
+
+        flammable = (ca.veg != Cell.vegetations.index('nov')) & \
+            (ca.state != 2)
+        ys, xs = np.nonzero(flammable[::spacing, ::spacing])
+
+        return [
+            Scenario([(y * spacing, x * spacing)], runs=runs)
+            for y, x in zip(ys.tolist(), xs.tolist())
+        ]
+
+
+class Ensemble:
+    """Class running many realizations of a wildfire on one landscape."""
+
+    def __init__(self, grid_filename, evolution_rule=VectorizedNNEvolutionRule,
+                 frontier=True, stencil=None):
+        """
+        Construct the ensemble.
+
+        Params:
+        - grid_filename: Filename of the initial grid
+        - evolution_rule: Class to use as the evolution rule of the CA
+        - frontier: Only evolve the fire front of the CA each step
+        - stencil: Stencil of the neighbors of the evolution rule, the
+                   default of the rule if None
+        """
+        self.ca = CA.from_gridfile(
+            grid_filename, evolution_rule, frontier, stencil=stencil
+        )
+
+    def run(self, runs, workers=None, seed=None, chunksize=None,
+            batch=False, stop=None):
+        """
+        Run the realizations, spread over a pool of worker processes.
+
+        Every run stops as soon as its fire is out, or at the first of the
+        stop criteria. The workers hand out the runs in small chunks, so a
+        worker whose runs stop early takes the next chunk at once instead of
+        idling until the longest run is done.
+
+        Params:
+        - runs: Amount of realizations to run
+        - workers: Amount of worker processes, defaults to the amount of CPUs
+        - seed: Seed from which the seeds of the runs are derived. The
+                results only depend on the seed, not on the amount of workers,
+                the chunks or batches.
+        - chunksize: Amount of runs a worker does per task
+        - batch: Evolve the runs of a task at once, as a BatchCA
+        - stop: StopCriteria of every run, until the fire is out if None.
+                The wall-clock time counts per run, or per batch.
+        """
+        if runs < 1:
+            raise ValueError("Ensembles need at least one run")
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        # Independent random streams for all runs
+        seeds = np.random.SeedSequence(seed).spawn(runs)
+
+        # Small chunks keep the workers busy until the end, as the duration
+        # of a run varies a lot
+        if chunksize is None:
+            chunksize = max(1, runs // (workers * 8))
+        chunks = [
+            seeds[i:i+chunksize] for i in range(0, runs, chunksize)
+        ]
+
+        run_chunk = _run_batch if batch else _run_chunk
+        result = EnsembleResult(self.ca.state.shape)
+        if workers == 1:
+            _init_worker(self.ca, stop)
+            for chunk in chunks:
+                result.add(*run_chunk(chunk))
+        else:
+            # the results come in the order of the seeds, whichever worker
+            # finishes first
+            with Pool(workers, _init_worker, (self.ca, stop)) as pool:
+                for chunk_result in pool.imap(run_chunk, chunks):
+                    result.add(*chunk_result)
+
+        return result
+
+    def run_scenarios(self, scenarios, workers=None, seed=None,
+                      chunksize=None, stop=None):
+        """
+        Run scenarios on the landscape, spread over worker processes.
+
+        The landscape is read and its factors of the ignition probabilities
+        are computed once, for all scenarios.
+
+        Params:
+        - scenarios: The Scenarios to run
+        - workers: Amount of worker processes, defaults to the amount of CPUs
+        - seed: Seed from which the seeds of the runs are derived. The
+                results only depend on the seed and the scenarios.
+        - chunksize: Amount of scenarios a worker does per task
+        - stop: StopCriteria of every run, until the fire is out if None.
+                The wall-clock time counts per run.
+        """
+        if not scenarios:
+            raise ValueError("There are no scenarios to run")
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        # independent random streams for all runs of all scenarios
+        tasks = [
+            (index, scenario, child.spawn(scenario.runs))
+            for index, (scenario, child) in enumerate(zip(
+                scenarios,
+                np.random.SeedSequence(seed).spawn(len(scenarios))
+            ))
+        ]
+
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (workers * 8))
+        chunks = [
+            tasks[i:i+chunksize] for i in range(0, len(tasks), chunksize)
+        ]
+
+        result = ScenarioResult(scenarios, self.ca.evolution_rule)
+        if workers == 1:
+            _init_worker(self.ca, stop)
+            for chunk in chunks:
+                result.add(_run_scenarios(chunk))
+        else:
+            with Pool(workers, _init_worker, (self.ca, stop)) as pool:
+                for rows in pool.imap_unordered(_run_scenarios, chunks):
+                    result.add(rows)
+
+        return result
+
+
+class EnsembleResult:
+    """Results of an ensemble, reduced over all of its runs."""
+
+    def __init__(self, shape):
+        """
+        Construct empty ensemble results.
+
+        Params:
+        - shape: Shape of the grid of the CA
+        """
+        self.runs = 0
+        self.burn_counts = np.zeros(shape, dtype=np.uint32)
+        self.scar_sizes = []
+        self.durations = []
+        self.stop_reasons = []
+
+    def add(self, burned, scar_sizes, durations, stop_reasons=None):
+        """
+        Add the results of a chunk of runs.
+
+        Params:
+        - burned: How often each cell burned in the chunk
+        - scar_sizes: Final scar size of each run in the chunk
+        - durations: Amount of steps of each run in the chunk
+        - stop_reasons: Why each run in the chunk stopped, see StopCriteria,
+                        the fire being out if None
+        """
+        if stop_reasons is None:
+            stop_reasons = ['out'] * len(scar_sizes)
+
+        self.runs += len(scar_sizes)
+        self.burn_counts += burned
+        self.scar_sizes.extend(scar_sizes)
+        self.durations.extend(durations)
+        self.stop_reasons.extend(stop_reasons)
+
+    def burn_probability(self):
+        """Return the probability per cell that it burns."""
+        return self.burn_counts / max(self.runs, 1)
+
+    def summary(self):
+        """Return a summary of the final scar sizes as text."""
+        sizes = np.array(self.scar_sizes)
+        p5, p50, p95 = np.percentile(sizes, [5, 50, 95])
+        reasons, counts = np.unique(self.stop_reasons, return_counts=True)
+
+        return (
+            "Runs: {}\n"
+            "Scar size: mean {:.1f}, std {:.1f}, min {}, max {}\n"
+            "Scar size percentiles: 5% {:.0f}, 50% {:.0f}, 95% {:.0f}\n"
+            "Mean duration: {:.1f} steps\n"
+            "Stopped: {}"
+        ).format(
+            self.runs, sizes.mean(), sizes.std(), sizes.min(), sizes.max(),
+            p5, p50, p95, np.mean(self.durations),
+            ", ".join(
+                "{} {}".format(reason, count)
+                for reason, count in zip(reasons, counts)
+            )
+        )
+
+    def save(self, filename):
+        """
+        Save the results as a NumPy .npz file.
+
+        Params:
+        - filename: Path to the file to save the results to
+        """
+        np.savez_compressed(
+            filename,
+            burn_probability=self.burn_probability(),
+            scar_sizes=np.array(self.scar_sizes),
+            durations=np.array(self.durations),
+            stop_reasons=np.array(self.stop_reasons)
+        )
+
+
+class ScenarioResult:
+    """Results of scenarios, as a table with a row per run."""
+
+    # Columns of the table, followed by the burned cells per vegetation type
+    columns = (
+        'scenario', 'run', 'ignitions', 'wind_dir_x', 'wind_dir_y',
+        'wind_speed', 'steps', 'burned', 'stop'
+    )
+
+    def __init__(self, scenarios, evolution_rule):
+        """
+        Construct empty scenario results.
+
+        Params:
+        - scenarios: The Scenarios that are run
+        - evolution_rule: The evolution rule of the landscape, with its wind
+        """
+        self.scenarios = scenarios
+        self.evolution_rule = evolution_rule
+        self.rows = []
+
+    def add(self, rows):
+        """
+        Add the results of runs.
+
+        Params:
+        - rows: Per run the index of the scenario, the run, the amount of
+                steps and burned cells, why it stopped (see StopCriteria)
+                and the burned cells per vegetation
+        """
+        self.rows.extend(rows)
+
+    def table(self):
+        """
+        Return the results as columns of a table, ordered by scenario and run.
+
+        The burned cells per vegetation type are named like burned_<veg>.
+        """
+        rows = sorted(self.rows)
+        table = {name: [] for name in self.columns}
+        for veg in Cell.vegetations:
+            table['burned_' + veg] = []
+
+        for index, run, steps, burned, stop, *burned_veg in rows:
+            scenario = self.scenarios[index]
+            wind_dir = self.evolution_rule.wind_dir
+            if scenario.wind_dir is not None:
+                wind_dir = np.divide(
+                    scenario.wind_dir, np.linalg.norm(scenario.wind_dir)
+                )
+            wind_speed = scenario.wind_speed
+            if wind_speed is None:
+                wind_speed = self.evolution_rule.wind_speed
+
+            row = [
+                index, run, len(scenario.ignitions), wind_dir[0],
+                wind_dir[1], wind_speed, steps, burned, stop
+            ] + burned_veg
+            for name, value in zip(table, row):
+                table[name].append(value)
+
+        return {name: np.array(values) for name, values in table.items()}
+
+    def summary(self):
+        """Return a summary of the scar sizes over the scenarios as text."""
+        table = self.table()
+        sizes = table['burned']
+        p5, p50, p95 = np.percentile(sizes, [5, 50, 95])
+        reasons, counts = np.unique(table['stop'], return_counts=True)
+
+        return (
+            "Scenarios: {}, runs: {}\n"
+            "Scar size: mean {:.1f}, min {}, max {}\n"
+            "Scar size percentiles: 5% {:.0f}, 50% {:.0f}, 95% {:.0f}\n"
+            "Stopped: {}"
+        ).format(
+            len(self.scenarios), len(sizes), sizes.mean(), sizes.min(),
+            sizes.max(), p5, p50, p95,
+            ", ".join(
+                "{} {}".format(reason, count)
+                for reason, count in zip(reasons, counts)
+            )
+        )
+
+    def save(self, filename):
+        """
+        Save the table as CSV, with a row per run.
+
+        Params:
+        - filename: Path to the CSV file
+        """
+        table = self.table()
+        columns = [values.astype(object) for values in table.values()]
+        np.savetxt(
+            filename, np.column_stack(columns), delimiter=',',
+            header=','.join(table), comments='',
+            fmt=['%s' if name == 'stop' else '%.9g' for name in table]
+        )
@@ -0,0 +1,232 @@
+"""Contains the history writer, streaming the spread of a fire to disk."""
+
+import numpy as np
+import os
+import queue
+import threading
+
+
+# Names of the files the history is written to
+ARRIVAL_FILE = 'time_of_arrival.npy'
+COUNTS_FILE = 'counts.csv'
+
+
+class HistoryWriter:
+    """
+    Class writing the history of a run to a directory, step by step.
+
+    The history consists of:
+    - time_of_arrival.npy: The step at which each cell ignited, as an int32
+                           raster, -1 for cells that didn't ignite during
+                           the run
+    - counts.csv: The amount of burning and burned out cells per step
+
+    Only the fire front is kept in memory. The ignitions of a step are the
+    burning cells that weren't burning the step before, as cells never
+    return to an earlier state. Writing is left to a background thread, so
+    the disk isn't touched by the loop evolving the CA.
+    """
+
+    def __init__(self, directory, background=True, queue_size=64,
+                 append=False):
+        """
+        Construct the writer.
+
+        Params:
+        - directory: Directory to write the history to, created if needed
+        - background: Write the history in a background thread
+        - queue_size: Amount of steps that may wait for the background
+                      thread before recording blocks
+        - append: Continue the history in the directory, for a run resumed
+                  from a checkpoint. What was written after the step the run
+                  resumes from is discarded.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.append = append
+        self.steps = 0
+
+        # linear indices of the cells that burned in the recorded step
+        self._front = None
+        self._width = None
+        self._arrival = None
+        self._counts = None
+
+        self._queue = None
+        self._error = None
+        if background:
+            self._queue = queue.Queue(queue_size)
+            self._thread = threading.Thread(target=self._work, daemon=True)
+            self._thread.start()
+
+    def record(self, ca):
+        """
+        Record the current step of a CA.
+
+        Record the initial state first, and then every step after it.
+
+        Params:
+        - ca: The CA, or TiledCA
+        """
+        ys, xs = ca.burning_positions()
+        front = np.sort(ys.astype(np.int64) * ca.shape[1] + xs)
+
+        if self._front is None:
+            task = ('open', ca.shape, ca.steps, front)
+        else:
+            ignited = front[~np.isin(front, self._front, assume_unique=True)]
+            task = ('step', ca.steps, ignited)
+        self._front = front
+        self.steps += 1
+
+        counts = (ca.steps, ca.burning_cells(), ca.burned_cells())
+        self._submit(task + (counts,))
+
+    def flush(self):
+        """
+        Write the recorded steps and flush the files to disk.
+
+        Call this before saving a checkpoint of the run, so the history on
+        disk holds every step up to it when the run is resumed.
+        """
+        if self._queue is not None:
+            self._queue.join()
+            if self._error is not None:
+                raise self._error
+
+        if self._arrival is not None:
+            self._arrival.flush()
+        if self._counts is not None:
+            self._counts.flush()
+
+    def close(self):
+        """Write the remaining steps and finish writing."""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+
+            if self._error is not None:
+                raise self._error
+
+        self._close_files()
+
+    def _submit(self, task):
+        """
+        Write a recorded step, or hand it to the background thread.
+
+        Params:
+        - task: The step to write, see _write
+        """
+        if self._queue is None:
+            self._write(task)
+            return
+
+        if self._error is not None:
+            raise self._error
+        self._queue.put(task)
+
+    def _work(self):
+        """Write the steps in the queue, until it holds None."""
+        tasks = self._queue
+        while True:
+            task = tasks.get()
+            if task is None:
+                tasks.task_done()
+                return
+
+            # keep emptying the queue after an error, so recording never
+            # blocks on it
+            if self._error is None:
+                try:
+                    self._write(task)
+                except Exception as e:
+                    self._error = e
+            tasks.task_done()
+
+    def _write(self, task):
+        """
+        Write a recorded step.
+
+        Params:
+        - task: ('open', shape, step, burning, counts) for the first step,
+                with the linear indices of the burning cells, or ('step',
+                step, ignited, counts) with the linear indices of the cells
+                that ignited
+        """
+        if task[0] == 'open':
+            _, shape, step, ignited, counts = task
+            self._open_files(shape, step)
+            if self.append:
+                ignited = ignited[self._arrival.flat[ignited] < 0]
+        else:
+            _, step, ignited, counts = task
+
+        self._arrival.flat[ignited] = step
+        self._counts.write('{},{},{}\n'.format(*counts))
+
+    def _open_files(self, shape, step):
+        """
+        Open the files of the history.
+
+        Params:
+        - shape: Amount of rows and columns of the grid
+        - step: The first recorded step
+        """
+        arrival_file = os.path.join(self.directory, ARRIVAL_FILE)
+        counts_file = os.path.join(self.directory, COUNTS_FILE)
+
+        if self.append and os.path.exists(arrival_file):
+            self._arrival = np.lib.format.open_memmap(arrival_file, 'r+')
+            if not self._arrival.shape == tuple(shape):
+                raise ValueError("The history is of a grid of another shape")
+
+            # forget what happened after the step the run resumes from, in
+            # blocks of rows to bound the memory it takes
+            rows = max(1, 2**20 // max(shape[1], 1))
+            for y in range(0, shape[0], rows):
+                block = self._arrival[y:y+rows]
+                block[block >= step] = -1
+
+            with open(counts_file) as f:
+                lines = f.readlines()
+            self._counts = open(counts_file, 'w')
+            self._counts.write(lines[0])
+            self._counts.writelines(
+                line for line in lines[1:] if int(line.split(',')[0]) < step
+            )
+        else:
+            self._arrival = np.lib.format.open_memmap(
+                arrival_file, 'w+', np.int32, tuple(shape)
+            )
+            self._arrival[...] = -1
+            self._counts = open(counts_file, 'w')
+            self._counts.write('step,burning,burned\n')
+
+    def _close_files(self):
+        """Flush and close the files of the history."""
+        if self._arrival is not None:
+            self._arrival.flush()
+            self._arrival = None
+        if self._counts is not None:
+            self._counts.close()
+            self._counts = None
+
+
+def read_history(directory):
+    """
+    Read a history written by a HistoryWriter.
+
+    Returns the time of arrival raster, memory mapped, and the counts as a
+    (steps, 3) array of the step, burning and burned out cells.
+
+    Params:
+    - directory: Directory the history was written to
+    """
+    arrival = np.load(os.path.join(directory, ARRIVAL_FILE), mmap_mode='r')
+    counts = np.loadtxt(
+        os.path.join(directory, COUNTS_FILE), dtype=np.int64, delimiter=',',
+        skiprows=1, ndmin=2
+    )
+
+    return arrival, counts
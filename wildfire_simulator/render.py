@@ -0,0 +1,214 @@
+"""Contains the renderer, writing the simulation to images headlessly."""
+
+from ca import CA
+import matplotlib.image
+import numpy as np
+import os
+import queue
+import threading
+
+
+# Colors of the cells, indexed by the color code of render_codes
+PALETTE = CA.palette.reshape(-1, 3)
+
+
+def render_codes(ca):
+    """
+    Return the color codes of the cells of a CA.
+
+    A color code combines the state, vegetation code and density code of a
+    cell into a single byte indexing PALETTE, so a frame can be colored later
+    in one lookup.
+
+    Params:
+    - ca: The CA to render
+    """
+    _, vegetations, densities, _ = CA.palette.shape
+    return (ca.state * vegetations + ca.veg) * densities + ca.dens
+
+
+class PNGWriter:
+    """Writes frames as numbered PNG images in a directory."""
+
+    def __init__(self, directory, scale=1):
+        """
+        Construct the writer.
+
+        Params:
+        - directory: Directory to write the images to, created if needed
+        - scale: Amount of pixels per cell along each axis
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.scale = scale
+
+    def write(self, step, codes):
+        """
+        Write a frame.
+
+        Params:
+        - step: The step of the simulation the frame shows
+        - codes: Color codes of the cells
+        """
+        codes = upscale(codes, self.scale)
+        filename = 'frame_{:05d}.png'.format(step)
+        matplotlib.image.imsave(
+            os.path.join(self.directory, filename), PALETTE[codes]
+        )
+
+    def close(self):
+        """Finish writing."""
+        pass
+
+
+class GIFWriter:
+    """Writes frames as an animated GIF, which needs Pillow."""
+
+    def __init__(self, filename, scale=1, fps=10):
+        """
+        Construct the writer.
+
+        Params:
+        - filename: Path to the GIF file
+        - scale: Amount of pixels per cell along each axis
+        - fps: Frames per second of the animation
+        """
+        from PIL import Image
+
+        self.image = Image
+        self.filename = filename
+        self.scale = scale
+        self.fps = fps
+        self.frames = []
+
+    def write(self, step, codes):
+        """
+        Add a frame.
+
+        The color codes are used as indices in the palette of the GIF, so the
+        frames keep their exact colors.
+
+        Params:
+        - step: The step of the simulation the frame shows
+        - codes: Color codes of the cells
+        """
+        frame = self.image.fromarray(upscale(codes, self.scale), 'P')
+        frame.putpalette(PALETTE.ravel().tolist())
+        self.frames.append(frame)
+
+    def close(self):
+        """Write the GIF file."""
+        if not self.frames:
+            return
+
+        self.frames[0].save(
+            self.filename, save_all=True, append_images=self.frames[1:],
+            duration=int(1000 / self.fps), loop=0
+        )
+
+
+def upscale(codes, scale):
+    """
+    Enlarge a frame by repeating each cell.
+
+    Params:
+    - codes: Color codes of the cells
+    - scale: Amount of pixels per cell along each axis
+    """
+    if scale == 1:
+        return codes
+
+    return np.repeat(np.repeat(codes, scale, axis=0), scale, axis=1)
+
+
+def writer_for(output, scale=1, fps=10):
+    """
+    Return a writer for a path, a GIF file if it ends in .gif.
+
+    Otherwise the path is a directory to write PNG images to.
+
+    Params:
+    - output: Path to write the frames to
+    - scale: Amount of pixels per cell along each axis
+    - fps: Frames per second of an animation
+    """
+    if output.lower().endswith('.gif'):
+        return GIFWriter(output, scale, fps)
+
+    return PNGWriter(output, scale)
+
+
+class Renderer:
+    """
+    Class rendering the steps of a CA to a writer.
+
+    Rendering only takes the color codes of the cells. Coloring, scaling and
+    encoding the frames is left to the writer, optionally in a background
+    thread so the simulation can continue meanwhile.
+    """
+
+    def __init__(self, writer, background=False, queue_size=8):
+        """
+        Construct the renderer.
+
+        Params:
+        - writer: Writer of the frames, like a PNGWriter or GIFWriter
+        - background: Write the frames in a background thread
+        - queue_size: Amount of frames that may wait for the background
+                      thread before rendering blocks
+        """
+        self.writer = writer
+        self.frames = 0
+        self._queue = None
+        self._error = None
+
+        if background:
+            self._queue = queue.Queue(queue_size)
+            self._thread = threading.Thread(target=self._work, daemon=True)
+            self._thread.start()
+
+    def render(self, step, ca):
+        """
+        Render the current state of a CA.
+
+        Params:
+        - step: The step of the simulation
+        - ca: The CA to render
+        """
+        codes = render_codes(ca)
+        self.frames += 1
+
+        if self._queue is None:
+            self.writer.write(step, codes)
+            return
+
+        if self._error is not None:
+            raise self._error
+        self._queue.put((step, codes))
+
+    def close(self):
+        """Write the remaining frames and finish writing."""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+
+            if self._error is not None:
+                raise self._error
+
+        self.writer.close()
+
+    def _work(self):
+        """Write the frames in the queue, until it holds None."""
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+
+            # keep emptying the queue after an error, so rendering never
+            # blocks on it
+            if self._error is None:
+                try:
+                    self.writer.write(*frame)
+                except Exception as e:
+                    self._error = e
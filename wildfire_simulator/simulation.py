@@ -1,29 +1,87 @@
 """Contains the simulation class, the outermost class of the simulation."""
 
-from ca import CA
+from ca import CA, MOORE, NNEvolutionRule, StopCriteria, TiledCA
+from ca import load_checkpoint
 from matplotlib.animation import FuncAnimation
+from matplotlib.colors import LightSource
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+from render import PALETTE, Renderer, render_codes, writer_for
+import threading
 
 
 class Simulation:
     """Class simulating a wildfire."""
 
-    def __init__(self, grid_filename, interval=100):
+    def __init__(self, grid_filename, interval=100,
+                 evolution_rule=NNEvolutionRule, frontier=False, seed=None,
+                 resume=None, wind_field=None, spotting=None, stencil=None):
         """
         Construct the simulation.
 
         Params:
-        - grid_filename: Filename of the initial grid
+        - grid_filename: Filename of the initial grid, or the directory of
+                         a tiled grid
         - interval: Amount of miliseconds between frames of the animation
+        - evolution_rule: Class to use as the evolution rule of the CA
+        - frontier: Only evolve the fire front of the CA each step
+        - seed: Seed of the random numbers, to reproduce a run
+        - resume: Checkpoint file to resume the simulation from. The grid
+                  file, evolution rule and seed are then the ones of the
+                  checkpoint.
+        - wind_field: WindField to use instead of the wind of the grid file
+        - spotting: Spotting of the fire by embers, like an EmberSpotting
+        - stencil: Stencil of the neighbors of the evolution rule, the
+                   default of the rule if None. Resumed runs use the one of
+                   the checkpoint.
         """
-        self.ca = CA.from_gridfile(grid_filename)
+        # the results of the run so far, when resuming it
+        self.resumed = {}
+
+        # why the last run of scar_size stopped, see StopCriteria
+        self.stop_reason = None
+
+        if resume is not None:
+            self.ca, self.resumed = load_checkpoint(resume)
+        elif os.path.isdir(grid_filename):
+            if stencil is not None and stencil is not MOORE:
+                raise ValueError("Tiled grids only support the 3x3 stencil")
+            self.ca = TiledCA(grid_filename, evolution_rule, seed)
+        else:
+            self.ca = CA.from_gridfile(
+                grid_filename, evolution_rule, frontier, seed, stencil
+            )
+
+        if wind_field is not None:
+            if isinstance(self.ca, TiledCA):
+                raise ValueError("Tiled grids don't support wind fields")
+            self.ca.evolution_rule.set_wind_field(wind_field)
+
+        if spotting is not None:
+            if isinstance(self.ca, TiledCA):
+                raise ValueError("Tiled grids don't support spotting")
+            spotting.check(self.ca.evolution_rule)
+            self.ca.spotting = spotting
         self.interval = interval
 
-    def run(self):
-        """Run the simulation."""
+    def run(self, steps_per_frame=None):
+        """
+        Run the simulation.
+
+        The CA evolves in a background thread, which publishes a snapshot of
+        the cells after every step. The animation shows the latest snapshot
+        at its own frame rate, only updating the colors of the surface.
+
+        Params:
+        - steps_per_frame: Evolve the CA this many steps per shown frame,
+                           or as fast as possible, skipping frames, if None
+        """
+        if isinstance(self.ca, TiledCA):
+            raise ValueError("Tiled grids can't be shown")
+
         # Disable imshow toolbar
         mpl.rcParams['toolbar'] = 'None'
 
@@ -32,70 +90,158 @@ class Simulation:
         ax = fig.add_subplot(111, projection='3d')
 
         # dimensions of our graph
-        h, w = self.ca.grid.shape
+        h, w = self.ca.state.shape
         xs, ys = range(w), range(h)
         X, Y = np.meshgrid(xs, ys)
         Z = self.ca.get_altitudes()
 
-        # needed variables to show our graph
-        colors = self.ca.grid_as_pixels()
-        plot = ax.plot_surface(X, Y, Z, facecolors=colors, rcount=h, ccount=w)
+        # the surface is drawn once, with fixed shading, after which only
+        # the colors of its faces change
+        shade = surface_shading(X, Y, Z)
+        colors = self.ca.grid_as_pixels() * shade
+        plot = ax.plot_surface(
+            X, Y, Z, facecolors=colors, rcount=h, ccount=w, shade=False
+        )
+        title = ax.set_title("Step 0")
 
-        # animation function. Evolves the CA to the next step and draws it.
-        def animate(i, plot):
-            self.ca.step()
-            colors = self.ca.grid_as_pixels()
+        snapshots = Snapshots(render_codes(self.ca), steps_per_frame)
+        thread = threading.Thread(
+            target=self._evolve, args=(snapshots,), daemon=True
+        )
 
-            ax.clear()
-            plot = ax.plot_surface(
-                X, Y, Z, facecolors=colors,
-                rcount=h, ccount=w
-            )
-            return plot
+        # animation function. Draws the latest snapshot of the CA.
+        def animate(i):
+            step, codes = snapshots.take()
+            if codes is not None:
+                colors = PALETTE[codes] / 255 * shade
+                plot.set_facecolor(colors[:-1, :-1].reshape(-1, 3))
+                title.set_text("Step {}".format(step))
 
-        # the function that gets called each step
-        animation = FuncAnimation(
-            fig, animate, interval=self.interval, fargs=(plot,)
-        )
+            return plot, title
+
+        # the function that gets called each frame
+        animation = FuncAnimation(fig, animate, interval=self.interval)
 
         # start showing the development of our animation
+        thread.start()
         plt.show()
 
+        # stop evolving once the window is closed
+        snapshots.close()
+        thread.join()
+
         # delete our animation func
         del animation
 
+    def _evolve(self, snapshots):
+        """
+        Evolve the CA until the fire is out, publishing its snapshots.
+
+        Params:
+        - snapshots: The snapshots to publish to
+        """
+        step = 0
+        while self.ca.burning_cells() > 0:
+            self.ca.step()
+            step += 1
+
+            if not snapshots.publish(step, render_codes(self.ca)):
+                return
+
+    def render(self, output, every=1, steps=None, scale=1, fps=10,
+               background=False):
+        """
+        Run the simulation without a display, rendering it to images.
+
+        The first and the last step are always rendered. Returns the amount
+        of rendered frames.
+
+        Params:
+        - output: A .gif file to write an animation to, or a directory to
+                  write PNG images to
+        - every: Amount of steps per rendered frame
+        - steps: Maximum amount of steps, until the fire is out if None
+        - scale: Amount of pixels per cell along each axis
+        - fps: Frames per second of an animation
+        - background: Write the images in a background thread
+        """
+        if isinstance(self.ca, TiledCA):
+            raise ValueError("Tiled grids can't be rendered")
+        if every < 1:
+            raise ValueError("Frames need to be at least one step apart")
+
+        renderer = Renderer(writer_for(output, scale, fps), background)
+
+        step = 0
+        renderer.render(step, self.ca)
+        try:
+            while self.ca.burning_cells() > 0 and \
+                    (steps is None or step < steps):
+                self.ca.step()
+                step += 1
+
+                if step % every == 0:
+                    renderer.render(step, self.ca)
+
+            if not step % every == 0:
+                renderer.render(step, self.ca)
+        finally:
+            renderer.close()
+
+        return renderer.frames
+
     def burned_cells(self):
         """How many cells have burned down."""
-        burned = 0
+        return self.ca.burned_cells()
 
-        for row in self.ca.grid:
-            for cell in row:
-                if cell.state == 2:
-                    burned += 1
+    def scar_size(self, checkpointer=None, history=None, stop=None):
+        """
+        Monitor the size of the burn scar over time.
 
-        return burned
+        Returns the amount of burned out cells after every step, starting
+        with the initial state. The run stops as soon as no cells are burning
+        anymore, or at the first of the stop criteria, and stop_reason tells
+        which. A resumed simulation continues the scar of its checkpoint.
 
-    def scar_size(self):
-        """Monitor the size of the burn scar over time."""
+        Params:
+        - checkpointer: Checkpointer saving the CA and the scar so far
+                        during the run
+        - history: HistoryWriter to record every step to
+        - stop: StopCriteria to stop the run earlier than when the fire is
+                out
+        """
+        if stop is None:
+            stop = StopCriteria()
+        stop.start()
 
-        burned = self.burned_cells()
-        prev_burned = -1
-        scar = np.array([burned])
+        scar = [self.burned_cells()]
+        if 'scar' in self.resumed:
+            scar = self.resumed['scar'].tolist()
 
-        # while there are still cells burning
-        while not prev_burned == burned:
-            # step
-            self.ca.step()
+        if history is not None:
+            history.record(self.ca)
 
-            # increment the data we are interested in
-            prev_burned = burned
-            burned = self.burned_cells()
+        # the CA counts its burning cells as it steps, so it tells at once
+        # when the fire is out
+        self.stop_reason = stop.reason(self.ca)
+        while self.stop_reason is None:
+            self.ca.step()
 
             # remember the results
-            scar = np.append(scar, burned)
+            scar.append(self.burned_cells())
+            if history is not None:
+                history.record(self.ca)
+            # the history has to be on disk up to the checkpoint, to be
+            # continued from it
+            if checkpointer is not None and checkpointer.due(self.ca):
+                if history is not None:
+                    history.flush()
+                checkpointer.save(self.ca, scar=scar)
+
+            self.stop_reason = stop.reason(self.ca)
 
         # and we are done
-        return scar
+        return np.array(scar)
 
     def scar_size_graph(self):
         """Generate a graph of the size of the burn scar over time."""
@@ -106,3 +252,99 @@ class Simulation:
         plt.ylabel("Burned cells")
         plt.xlabel("Time step")
         plt.show()
+
+
+class Snapshots:
+    """
+    Snapshots of the CA, passed from the thread evolving it to the display.
+
+    Only the latest snapshot is kept. Without a fixed amount of steps per
+    frame, the evolving thread never waits and the display skips the
+    snapshots it had no time for.
+    """
+
+    def __init__(self, codes, steps_per_frame=None):
+        """
+        Construct the snapshots.
+
+        Params:
+        - codes: Color codes of the cells in the initial state
+        - steps_per_frame: Let the evolving thread wait after this many
+                           steps, until the display took the snapshot
+        """
+        if steps_per_frame is not None and steps_per_frame < 1:
+            raise ValueError("Frames need to be at least one step apart")
+
+        self.steps_per_frame = steps_per_frame
+        self._condition = threading.Condition()
+        self._step = 0
+        self._codes = codes
+        self._taken = 0
+        self._closed = False
+
+    def publish(self, step, codes):
+        """
+        Publish a snapshot.
+
+        Returns False when the display is closed, so evolving can stop.
+
+        Params:
+        - step: The step of the snapshot
+        - codes: Color codes of the cells
+        """
+        with self._condition:
+            if self.steps_per_frame is not None:
+                self._condition.wait_for(
+                    lambda: self._closed
+                    or step - self._taken <= self.steps_per_frame
+                )
+
+            self._step, self._codes = step, codes
+            return not self._closed
+
+    def take(self):
+        """Return the step and the codes of the latest snapshot, if new."""
+        with self._condition:
+            step, codes = self._step, self._codes
+            self._codes = None
+            self._taken = step
+            self._condition.notify_all()
+
+        return step, codes
+
+    def close(self):
+        """Stop the evolving thread from waiting for the display."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def surface_shading(X, Y, Z):
+    """
+    Return the brightness of the faces of a surface, lit from the side.
+
+    This shades the faces like plot_surface does, so they can be recolored
+    without letting plot_surface shade them again. The result is indexed like
+    the vertices, with the faces indexed by their first vertex.
+
+    Params:
+    - X: X coordinates of the vertices
+    - Y: Y coordinates of the vertices
+    - Z: Z coordinates of the vertices
+    """
+    # normals of the faces, from the same corners as plot_surface takes
+    vertices = np.stack([X, Y, Z], axis=-1).astype(float)
+    normals = np.cross(
+        vertices[:-1, :-1] - vertices[:-1, 1:],
+        vertices[:-1, 1:] - vertices[1:, 1:]
+    )
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+
+    # the light source and brightness range of plot_surface
+    light = LightSource(azdeg=225, altdeg=19.4712)
+    brightness = normals @ light.direction
+
+    shading = np.ones(X.shape)
+    shading[:-1, :-1] = 0.3 + 0.7 * (brightness + 1) / 2
+
+    return shading[..., np.newaxis]